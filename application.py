@@ -1,28 +1,38 @@
 from datetime import timedelta
 
+import pandas as pd
 from flask import Flask
 from flask_jwt_extended import (
     JWTManager
 )
 
-import aws_connections
-import endpoints
-from trading_algorithms import *
-
 pd.options.mode.chained_assignment = None  # default='warn'
 
-# Application
-application = Flask(__name__)
-application.config["JWT_SECRET_KEY"] = aws_connections.get_secret_from_secrets_manager(aws_connections.SECRETS_MANAGER, "jwt_secret_key")
-application.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
-jwt = JWTManager(application)
 
-application.register_blueprint(endpoints.SWAGGER_BLUEPRINT, url_prefix=endpoints.SWAGGER_URL)
+def create_application():
+    # Importing them creates the AWS clients and the caches
+    import aws_connections
+    import endpoints
+
+    application = Flask(__name__)
+    application.config["JWT_SECRET_KEY"] = aws_connections.get_secret_from_secrets_manager(aws_connections.SECRETS_MANAGER, "jwt_secret_key")
+    application.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
+    JWTManager(application)
+
+    application.register_blueprint(endpoints.SWAGGER_BLUEPRINT, url_prefix=endpoints.SWAGGER_URL)
+
+    application.register_blueprint(endpoints.AUTH)
+    application.register_blueprint(endpoints.MISC)
+    application.register_blueprint(endpoints.ALGO)
+    application.register_blueprint(endpoints.STATS)
+
+    return application
+
 
-application.register_blueprint(endpoints.AUTH)
-application.register_blueprint(endpoints.MISC)
-application.register_blueprint(endpoints.ALGO)
-application.register_blueprint(endpoints.STATS)
+# The spawned robustness workers run this file again as __mp_main__ when it was started directly,
+# they only need the robustness code and skip the secrets, the AWS clients and the memcached discovery
+if __name__ != '__mp_main__':
+    application = create_application()
 
 if __name__ == "__main__":
     application.run(debug=True)
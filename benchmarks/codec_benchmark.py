@@ -0,0 +1,81 @@
+import argparse
+import math
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_codec import CHUNK_SIZE, COMPRESSORS, decode_frame, encode_frame
+
+
+def generate_frame(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.0005, bars))), 4)
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.round(np.abs(rng.normal(0, 0.0003, bars)) * close, 4)
+
+    # 1m session bars, 390 per day with the overnight and weekend gaps Yahoo returns
+    days = pd.bdate_range('2020-01-02', periods=math.ceil(bars / 390))
+    minutes = pd.to_timedelta(np.arange(9 * 60 + 30, 16 * 60), unit='min')
+    index = pd.DatetimeIndex((days.to_numpy()[:, np.newaxis] + minutes.to_numpy()).ravel()[:bars])
+
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Adj Close': close,
+        'Volume': rng.integers(1_000, 100_000, bars)
+    }, index=index.tz_localize('America/New_York').rename('Datetime'))
+
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Size and speed of the cached frame codec compared with pickle')
+    parser.add_argument('--bars', type=int, nargs='+', default=[2_730, 23_400, 196_560])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    codecs = {'pickle': (lambda frame: pickle.dumps(frame, pickle.HIGHEST_PROTOCOL), pickle.loads)}
+    for compression in COMPRESSORS:
+        for dtype in [None, np.float32]:
+            name = compression + ('_float32' if dtype else '')
+            codecs[name] = (
+                lambda frame, compression=compression, dtype=dtype: encode_frame(frame, dtype, compression),
+                decode_frame
+            )
+
+    print(f'{"bars":>8}  {"codec":<14}{"bytes":>12}{"ratio":>8}{"items":>7}{"enc MB/s":>10}{"dec MB/s":>10}  round trip')
+    for bars in args.bars:
+        frame = generate_frame(bars)
+        raw = frame.memory_usage(index=True).sum() / 1e6
+        pickled = len(codecs['pickle'][0](frame))
+
+        for name, (encode, decode) in codecs.items():
+            encode_time, data = best_time(lambda: encode(frame), args.repeat)
+            decode_time, decoded = best_time(lambda: decode(data), args.repeat)
+
+            exact = decoded.equals(frame)
+            close = exact or (decoded.index.equals(frame.index) and np.allclose(decoded, frame, rtol=1e-6))
+            items = math.ceil(len(data) / CHUNK_SIZE)
+
+            print(f'{bars:>8}  {name:<14}{len(data):>12}{pickled / len(data):>8.2f}{items:>7}'
+                  f'{raw / encode_time:>10.0f}{raw / decode_time:>10.0f}  {"exact" if exact else "float32" if close else "FAILED"}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_engine import Bars, EventEngine
+
+CONFIGURATIONS = {
+    'market': dict(),
+    'stops': dict(stop_loss=0.01, take_profit=0.02),
+    'stops_and_limits': dict(stop_loss=0.01, take_profit=0.02, limit_offset=0.001, limit_ttl=20)
+}
+
+
+def generate_fixture(bars, holding, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, bars)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0003, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0003, bars)))
+    positions = np.repeat(rng.choice([-1, 0, 1], bars // holding + 1), holding)[:bars]
+
+    return Bars(open_, high, low, close), positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bars per second processed by the event engine')
+    parser.add_argument('--bars', type=int, default=2_000_000)
+    parser.add_argument('--holding', type=int, default=100, help='average number of bars between signals')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    bars, positions = generate_fixture(args.bars, args.holding)
+
+    print(f'{"configuration":<20}{"fills":>10}{"seconds":>10}{"M bars/s":>10}')
+    for name, options in CONFIGURATIONS.items():
+        engine = EventEngine(**options)
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fills, _ = engine.simulate(bars, positions)
+            best = min(best, time.perf_counter() - start)
+        print(f'{name:<20}{len(fills):>10}{best:>10.3f}{args.bars / best / 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
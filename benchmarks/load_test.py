@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TICKERS = ['AAPL', 'MSFT', 'AMZN', 'GOOGL', 'TSLA', 'NVDA', 'META', 'JPM']
+
+# Mix of requests replayed against /simulate, weighted like the traffic the application usually gets
+SCENARIOS = [
+    (5, dict(algorithm='mean_reversion', period='12mo', interval='1d', time_window=20)),
+    (3, dict(algorithm='double_rsi', period='1mo', interval='15m', rsi_short_period=14, rsi_long_period=28)),
+    (1, dict(algorithm='double_rsi', period='1mo', interval='15m', filter_interval='1h')),
+    (1, dict(algorithm='arbitrage', period='12mo', interval='1d', ticker2='SPY', entry_threshold=2.0)),
+]
+
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.local = threading.local()
+
+    def post(self, path, payload, headers=None):
+        # One connection pool per worker thread, as a real client would keep alive
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        response = self.local.session.post(self.url + path, json=payload, headers=headers)
+        return response.status_code, response.json() if response.ok else None
+
+
+class InMemoryTable:
+    def __init__(self):
+        self.items = list()
+        self.lock = threading.Lock()
+
+    def put_item(self, Item, TableName=None):
+        with self.lock:
+            self.items.append(Item)
+
+    @contextlib.contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        yield self
+
+
+# Replaces Secrets Manager, S3 and DynamoDB in memory and trades synthetic prices, nothing leaves the process
+def install_offline_stubs(username, password, seed):
+    import aws_connections
+    from data_sources import SyntheticDataSource
+
+    stored_secrets = {
+        "jwt_secret_key": secrets.token_hex(32),
+        "credentials": {"username": username, "password": password}
+    }
+    aws_connections.get_secret_from_secrets_manager = lambda secrets_manager, key: stored_secrets[key]
+    aws_connections.put_s3_item = lambda s3, name, item, content_type: None
+    aws_connections.DYNAMODB_TABLE = InMemoryTable()
+
+    import endpoints
+    import trading_algorithms
+    endpoints.DATA_SOURCE = trading_algorithms.DATA_SOURCE = SyntheticDataSource(seed)
+
+
+class InProcessClient:
+    def __init__(self, offline=False, username=None, password=None, seed=0):
+        if offline:
+            install_offline_stubs(username, password, seed)
+        from application import application
+        self.client = application.test_client()
+
+    def post(self, path, payload, headers=None):
+        response = self.client.post(path, json=payload, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+def make_payload(rng, vary):
+    payload = dict(rng.choices([scenario for _, scenario in SCENARIOS], weights=[weight for weight, _ in SCENARIOS])[0])
+    payload['ticker'] = rng.choice(TICKERS)
+
+    # Jittered parameters miss the result cache, so every request runs a backtest
+    if vary:
+        for name, value in payload.items():
+            if type(value) is int:
+                payload[name] = max(2, value + rng.randint(-value // 2, value // 2))
+            elif type(value) is float:
+                payload[name] = round(value * rng.uniform(0.5, 1.5), 3)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and latency of /simulate under concurrent load')
+    parser.add_argument('--url', help='base url of a running application, the application is run in process if omitted')
+    parser.add_argument('--username', default=os.environ.get('LOAD_TEST_USERNAME'))
+    parser.add_argument('--password', default=os.environ.get('LOAD_TEST_PASSWORD'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--vary', action='store_true', help='randomize the parameters to bypass the result cache')
+    parser.add_argument('--offline', action='store_true',
+                        help='run in process with AWS replaced in memory and synthetic prices, the credentials are accepted as given')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.offline and args.url:
+        parser.error('--offline runs the application in process, it cannot be combined with --url')
+    if args.offline:
+        args.username = args.username or 'load_test'
+        args.password = args.password or secrets.token_hex(8)
+
+    client = HttpClient(args.url) if args.url else InProcessClient(args.offline, args.username, args.password, args.seed)
+
+    status, body = client.post('/auth', dict(username=args.username, password=args.password))
+    if status != 200:
+        sys.exit(f'Authentication failed with status {status}')
+    headers = {'Authorization': f'Bearer {body["access_token"]}'}
+
+    rng = random.Random(args.seed)
+    payloads = [make_payload(rng, args.vary) for _ in range(args.requests)]
+
+    def send(payload):
+        start = time.perf_counter()
+        try:
+            status, _ = client.post('/simulate', payload, headers)
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    errors = sum(1 for _, status in results if status != 200)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+    print(f'{"requests":<16}{len(results):>12}')
+    print(f'{"errors":<16}{errors:>12}')
+    print(f'{"seconds":<16}{elapsed:>12.2f}')
+    print(f'{"requests/s":<16}{len(results) / elapsed:>12.2f}')
+    print(f'{"p50 ms":<16}{p50:>12.1f}')
+    print(f'{"p95 ms":<16}{p95:>12.1f}')
+    print(f'{"p99 ms":<16}{p99:>12.1f}')
+    print(f'{"max ms":<16}{latencies.max():>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_data import MarketData
+from trading_algorithms import MeanReversion
+
+MODES = ['frame', 'shared', 'shared_float32']
+
+
+def get_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_frame(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, bars)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.0005, bars)) * close
+
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Adj Close': close,
+        'Volume': rng.integers(1000, 100000, bars).astype(np.float64)
+    }, index=pd.date_range('2023-01-02 09:30', periods=bars, freq='min'))
+
+
+def run_mode(mode, bars, requests, queue):
+    frame = generate_frame(bars)
+    benchmark = generate_frame(bars, seed=1)
+
+    if mode == 'shared':
+        data, benchmark = MarketData.from_frame(frame), MarketData.from_frame(benchmark)
+    elif mode == 'shared_float32':
+        data, benchmark = MarketData.from_frame(frame, np.float32), MarketData.from_frame(benchmark, np.float32)
+    del frame
+
+    baseline = get_rss_mb()
+    runs = list()
+
+    # Runs are kept alive to mimic requests being served at the same time
+    for _ in range(requests):
+        alg_data = generate_frame(bars) if mode == 'frame' else data
+        alg = MeanReversion(alg_data, 'TEST', '7d', '1m', benchmark)
+        alg.prepare_data()
+        alg.generate_signals()
+        alg.execute_trades()
+        runs.append(alg)
+
+    queue.put((mode, baseline, get_rss_mb()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request RSS of concurrent 1m simulations')
+    parser.add_argument('--bars', type=int, default=200_000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+
+    print(f'{"mode":<16}{"baseline MB":>14}{"total MB":>12}{"per request MB":>18}')
+    for mode in MODES:
+        process = context.Process(target=run_mode, args=(mode, args.bars, args.requests, queue))
+        process.start()
+        mode, baseline, total = queue.get()
+        process.join()
+        print(f'{mode:<16}{baseline:>14.1f}{total:>12.1f}{(total - baseline) / args.requests:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import math
+import os
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from market_data import MarketData, market_data_config
+from resampling import CALENDAR_INTERVALS, SESSION_CLOSE_HOUR, SESSION_OPEN_HOUR, interval_minutes, period_days, resample
+
+EXCHANGE_TZ = 'America/New_York'
+DEFAULT_BETA = 1.0
+
+SYNTHETIC_END = '2024-01-02'
+SYNTHETIC_MAX_DAYS = 3650
+TRADING_DAYS = 252
+
+# Annual drift and volatility of the regimes the synthetic prices switch between
+SYNTHETIC_REGIMES = [
+    (0.15, 0.12),
+    (0.00, 0.18),
+    (-0.25, 0.35)
+]
+SYNTHETIC_REGIME_DAYS = 60
+
+
+class DataSource(ABC):
+    @abstractmethod
+    def download(self, ticker, period, interval):
+        pass
+
+    def beta(self, ticker):
+        return DEFAULT_BETA
+
+
+class YahooDataSource(DataSource):
+    def download(self, ticker, period, interval):
+        return yf.download(ticker, period=period, interval=interval)
+
+    def beta(self, ticker):
+        return yf.Ticker(ticker).info.get('beta', DEFAULT_BETA)
+
+
+def start_of_period(end, period):
+    if period == 'ytd':
+        return end.replace(month=1, day=1).normalize()
+    days = period_days(period)
+    return (end - pd.Timedelta(days=SYNTHETIC_MAX_DAYS if math.isinf(days) else days)).normalize()
+
+
+# Replays frames recorded with `save`, one CSV per ticker and interval, cut to the requested period
+class FileDataSource(DataSource):
+    def __init__(self, directory):
+        if not directory or not os.path.isdir(directory):
+            raise ValueError("The file data source needs an existing source_dir, got {directory}".format(directory=directory))
+        self.directory = directory
+
+    def path(self, ticker, interval):
+        # The ticker comes from the request, it must not lead outside the directory
+        if '/' in ticker or '\\' in ticker:
+            raise ValueError("The ticker {ticker} is invalid".format(ticker=ticker))
+        return os.path.join(self.directory, '{ticker}_{interval}.csv'.format(ticker=ticker, interval=interval))
+
+    def save(self, frame, ticker, interval):
+        frame.to_csv(self.path(ticker, interval))
+
+    def download(self, ticker, period, interval):
+        path = self.path(ticker, interval)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+
+        frame = pd.read_csv(path, index_col=0)
+        index = pd.to_datetime(frame.index, utc=True)
+        frame.index = index.tz_convert(EXCHANGE_TZ) if interval_minutes(interval) is not None else index.tz_localize(None)
+
+        if period == 'max' or frame.empty:
+            return frame
+        return frame[frame.index >= start_of_period(frame.index[-1], period)]
+
+
+# Geometric Brownian motion switching between regimes, the same seed and ticker always give the same bars
+class SyntheticDataSource(DataSource):
+    def __init__(self, seed=0, end=SYNTHETIC_END):
+        self.seed = seed
+        self.end = pd.Timestamp(end)
+
+    def bar_index(self, period, interval):
+        days = pd.bdate_range(start_of_period(self.end, period), self.end)
+        minutes = interval_minutes(interval)
+        if minutes is None:
+            return days
+
+        session = np.arange(SESSION_OPEN_HOUR * 60, SESSION_CLOSE_HOUR * 60, minutes)
+        offsets = pd.to_timedelta(session, unit='min')
+        times = (days.to_numpy()[:, np.newaxis] + offsets.to_numpy()[np.newaxis, :]).ravel()
+        return pd.DatetimeIndex(times).tz_localize(EXCHANGE_TZ)
+
+    def download(self, ticker, period, interval):
+        if interval_minutes(interval) is None and interval not in CALENDAR_INTERVALS:
+            return pd.DataFrame()
+
+        index = self.bar_index(period, interval if interval_minutes(interval) is not None else '1d')
+        bars = len(index)
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+
+        bars_per_day = max(1, round(bars / max(1, len(np.unique(index.normalize())))))
+        dt = 1 / (TRADING_DAYS * bars_per_day)
+
+        switches = rng.random(bars) < 1 / (SYNTHETIC_REGIME_DAYS * bars_per_day)
+        regimes = rng.integers(0, len(SYNTHETIC_REGIMES), np.count_nonzero(switches) + 1)[np.cumsum(switches)]
+        drift, volatility = np.array(SYNTHETIC_REGIMES)[regimes].T
+
+        log_returns = (drift - volatility ** 2 / 2) * dt + volatility * np.sqrt(dt) * rng.standard_normal(bars)
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(log_returns))
+        open_ = np.concatenate([[close[0]], close[:-1]])
+        wick = np.abs(rng.standard_normal((2, bars))) * volatility * np.sqrt(dt) / 2
+
+        frame = pd.DataFrame({
+            'Open': open_,
+            'High': np.maximum(open_, close) * (1 + wick[0]),
+            'Low': np.minimum(open_, close) * (1 - wick[1]),
+            'Close': close,
+            'Adj Close': close,
+            'Volume': np.round(rng.lognormal(13, 0.5, bars) / bars_per_day)
+        }, index=index)
+        frame.index.name = 'Datetime' if interval_minutes(interval) is not None else 'Date'
+
+        if interval in CALENDAR_INTERVALS and interval != '1d':
+            return resample(MarketData.from_frame(frame), interval).to_frame()
+        return frame
+
+
+def get_data_source(name, directory=None, seed=0):
+    if name == 'yahoo':
+        return YahooDataSource()
+    if name == 'file':
+        return FileDataSource(directory)
+    if name == 'synthetic':
+        return SyntheticDataSource(seed)
+    raise ValueError("The data source {name} does not exist, use yahoo, file or synthetic".format(name=name))
+
+
+DATA_SOURCE = get_data_source(
+    market_data_config.get("source") or "yahoo",
+    market_data_config.get("source_dir") or None,
+    int(market_data_config.get("source_seed") or 0)
+)
@@ -3,23 +3,33 @@ import json
 import random
 import string
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from decimal import Decimal
 from io import StringIO
 from boto3.dynamodb.conditions import Key
-from flask import jsonify, request, redirect, Blueprint
+from flask import jsonify, request, redirect, Blueprint, Response, stream_with_context
 from flask_jwt_extended import (
     create_access_token, jwt_required
 )
 from flask_swagger_ui import get_swaggerui_blueprint
 
 import aws_connections
+from data_sources import DATA_SOURCE
+from event_engine import EventEngine
+from frame_codec import get_frame, set_frame
+from market_data import MARKET_DATA_CACHE, MARKET_DATA_DTYPE, MarketData
+from resampling import INTERVALS, resample, resample_source
+from robustness import run_robustness
+from result_cache import ResultCache, request_fingerprint
+from strategy_registry import STRATEGIES
 from trading_algorithms import *
 
 # region Constants
 
 PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '12mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
-INTERVALS = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo']
-ALGORITHMS = ['double_rsi', 'mean_reversion', 'arbitrage']
+ALGORITHMS = list(STRATEGIES)
+ENGINES = ['vectorized', 'event']
+CONFIGURATION = {name: strategy.configuration for name, strategy in STRATEGIES.items()}
 CHECK_CONFIG = "\nCheck the /configuration endpoint to see the available configurations"
 CONFIG_NOTES = "1m data is only for available for last 7 days, and data interval <1d for the last 60 days"
 # endregion
@@ -72,6 +82,8 @@ def home():
 def get_algorithms():
     return jsonify(
         algorithm=ALGORITHMS,
+        algorithms=CONFIGURATION,
+        engine=ENGINES,
         period=PERIODS,
         interval=INTERVALS,
         notes=CONFIG_NOTES
@@ -82,151 +94,371 @@ def get_algorithms():
 
 # region Algorithms
 
+def data_key(ticker, period, interval):
+    return ticker + period + interval
+
+
 def get_financial_data(ticker, period, interval):
-    key = ticker + period + interval
+    key = data_key(ticker, period, interval)
     ticker_data = None
     if aws_connections.MEMCACHE is not None:
-        ticker_data = aws_connections.MEMCACHE.get(key)
+        ticker_data = get_frame(aws_connections.MEMCACHE, key)
     if ticker_data is None:
-        ticker_data = yf.download(ticker, period=period, interval=interval)
+        ticker_data = DATA_SOURCE.download(ticker, period, interval)
         if aws_connections.MEMCACHE is not None:
-            aws_connections.MEMCACHE.set(key, ticker_data, 12 * 60 * 60)
+            # The prices are only read through MarketData, storing them at its precision loses nothing
+            set_frame(aws_connections.MEMCACHE, key, ticker_data, 12 * 60 * 60, MARKET_DATA_DTYPE)
     return ticker_data
 
 
-def gen_random_string():
-    return ''.join(random.sample(string.ascii_letters + string.digits, 16))
+# Key of the download an interval is derived from
+def market_data_key(ticker, period, interval):
+    return data_key(ticker, period, resample_source(period, interval))
 
 
-ALGO = Blueprint('algo', __name__)
+def get_market_data(ticker, period, interval):
+    source = resample_source(period, interval)
+    key = data_key(ticker, period, source)
+    market_data = MARKET_DATA_CACHE.get(key)
+    if market_data is None:
+        market_data = MARKET_DATA_CACHE.put(key, MarketData.from_frame(get_financial_data(ticker, period, source)))
+        RESULT_CACHE.invalidate(key)
 
+    if source != interval:
+        return resample(market_data, interval)
+    return market_data
 
-@ALGO.route('/simulate', methods=["POST"])
-@jwt_required()
-def simulate():
-    try:
-        algorithm_parameters = dict()
-        data = dict(request.json)
-        ticker = data.get("ticker", "AAPL")
-        period = data.get("period", "12mo")
 
-        if period not in PERIODS:
-            return "The selected period is incorrect" + CHECK_CONFIG, 400
+def gen_random_string():
+    return ''.join(random.sample(string.ascii_letters + string.digits, 16))
 
-        interval = data.get("interval", "1d")
 
-        if interval not in interval:
-            return "The selected interval is incorrect" + CHECK_CONFIG, 400
+RESULT_CACHE = ResultCache(aws_connections.MEMCACHE)
 
-        ticker_data = get_financial_data(ticker, period, interval)
+BATCH_MAX_SIZE = 100
+BATCH_WORKERS = 8
 
-        if ticker_data.empty:
-            return "The ticker {ticker} does not exist or has been removed or the period/interval is invalid".format(ticker=ticker) + CHECK_CONFIG, 400
+ROBUSTNESS_MAX_SIMULATIONS = 10000
+ROBUSTNESS_MAX_PERTURBATIONS = 50
 
-        algorithm = data.get("algorithm", "")
 
-        if algorithm not in ALGORITHMS:
-            return "The selected algorithm does not exist" + CHECK_CONFIG, 400
+class SimulationError(Exception):
+    pass
 
-        benchmark_data = get_financial_data("SPY", period, interval)
 
-        alg = None
+# Returns the engine and its options, the options are reported and fingerprinted with the strategy parameters
+# but are not passed to the strategy
+def parse_engine(data, strategy):
+    engine = data.get("engine", "vectorized")
 
-        if algorithm == "double_rsi":
-            rsi_short_period = data.get("rsi_short_period", 14)
-            rsi_long_period = data.get("rsi_long_period", 28)
+    if engine not in ENGINES:
+        raise SimulationError("The selected engine does not exist" + CHECK_CONFIG)
 
-            if not (type(rsi_long_period) is int and type(rsi_long_period) is int):
-                return "The RSI periods must be positive integers", 400
+    if engine not in strategy.ENGINES:
+        raise SimulationError("The selected engine is not available for the {algorithm} algorithm".format(algorithm=strategy.NAME) + CHECK_CONFIG)
 
-            if not (rsi_long_period > 0 and rsi_long_period > 0):
-                return "The RSI periods must be positive integers", 400
+    if engine == "vectorized":
+        return None, dict()
 
-            algorithm_parameters["rsi_short_period"] = rsi_short_period
-            algorithm_parameters["rsi_long_period"] = rsi_long_period
+    options = dict()
+    for name in ["stop_loss", "take_profit", "limit_offset"]:
+        value = data.get(name)
+        if value is None:
+            continue
 
-            alg = DoubleRSI(ticker_data, ticker, period, interval, benchmark_data, rsi_short_period, rsi_long_period)
+        if not (type(value) is int or type(value) is float) or value <= 0:
+            raise SimulationError("The stop_loss, take_profit and limit_offset must be positive numbers")
+        options[name] = value
 
-        elif algorithm == "mean_reversion":
-            time_window = data.get("time_window", 20)
+    limit_ttl = data.get("limit_ttl")
+    if limit_ttl is not None:
+        if not (type(limit_ttl) is int) or limit_ttl <= 0:
+            raise SimulationError("The limit_ttl must be strictly positive integer")
+        options["limit_ttl"] = limit_ttl
 
-            if not (type(time_window) is int):
-                return "The time window must be strictly positive integer", 400
+    return EventEngine(**options), {"engine": engine, **options}
 
-            if time_window <= 0:
-                return "The time window must be strictly positive integer", 400
 
-            algorithm_parameters["time_window"] = time_window
+def prepare_simulation(data):
+    ticker = data.get("ticker", "AAPL")
+    period = data.get("period", "12mo")
 
-            alg = MeanReversion(ticker_data, ticker, period, interval, benchmark_data, time_window)
+    if period not in PERIODS:
+        raise SimulationError("The selected period is incorrect" + CHECK_CONFIG)
 
-        elif algorithm == "arbitrage":
-            entry_threshold = data.get("entry_threshold", 2)
-            exit_threshold = data.get("exit_threshold", 0)
+    interval = data.get("interval", "1d")
 
-            if not ((type(entry_threshold) is int or type(entry_threshold) is float) and (type(exit_threshold) is int or type(exit_threshold) is float)):
-                return "The entry_threshold and exit_threshold must be non-negative numbers", 400
+    if interval not in INTERVALS:
+        raise SimulationError("The selected interval is incorrect" + CHECK_CONFIG)
 
-            if entry_threshold < 0 or exit_threshold < 0:
-                return "The entry_threshold and exit_threshold must be non-negative numbers", 400
+    algorithm = data.get("algorithm", "")
 
-            ticker2 = data.get("ticker2", "SPY")
+    if algorithm not in STRATEGIES:
+        raise SimulationError("The selected algorithm does not exist" + CHECK_CONFIG)
 
-            algorithm_parameters["entry_threshold"] = entry_threshold
-            algorithm_parameters["exit_threshold"] = exit_threshold
-            algorithm_parameters["ticker2"] = ticker2
+    strategy = STRATEGIES[algorithm]
 
-            arbitrage_data = get_financial_data(ticker2, period, interval)
+    try:
+        algorithm_parameters = strategy.validate_parameters(data)
+    except ValueError as e:
+        raise SimulationError(str(e))
+
+    engine, engine_options = parse_engine(data, strategy)
+
+    # The first key is the traded ticker and the second the benchmark, the others are passed to the strategy
+    keys = strategy.data_keys(ticker, period, interval, algorithm_parameters)
+    dependencies = dict()
+    market_data = list()
+    for key in keys:
+        key_data = get_market_data(*key)
+        if key_data.empty:
+            raise SimulationError("The ticker {ticker} does not exist or has been removed or the period/interval is invalid".format(ticker=key[0]) + CHECK_CONFIG)
+
+        dependencies[market_data_key(*key)] = key_data
+        market_data.append(key_data)
+
+    ticker_data, benchmark_data = market_data[:2]
+    extra_data = dict(zip(strategy.DATA_PARAMETERS.values(), market_data[2:]))
+
+    alg = strategy(ticker_data, ticker, period, interval, benchmark_data, **extra_data, **algorithm_parameters)
+
+    return {
+        "algorithm": algorithm,
+        "ticker": ticker,
+        "period": period,
+        "interval": interval,
+        "parameters": algorithm_parameters,
+        "engine_options": engine_options,
+        "dependencies": list(dependencies),
+        "fingerprint": request_fingerprint(algorithm, ticker, period, interval, {**algorithm_parameters, **engine_options},
+                                           {key: key_data.version for key, key_data in dependencies.items()}),
+        "alg": alg,
+        "engine": engine
+    }
 
-            if arbitrage_data.empty:
-                return "The ticker {ticker} does not exist or has been removed".format(ticker=ticker2), 400
 
-            alg = Arbitrage(ticker_data, ticker, period, interval, benchmark_data, arbitrage_data, ticker2, entry_threshold,
-                            exit_threshold)
+def run_simulation(simulation, timestamp_format="%Y-%m-%d %H:%M:%S"):
+    alg = simulation["alg"]
+    alg.run_algorithm(simulation["engine"])
+
+    chart_name = gen_random_string()
+    str_obj = StringIO()
+    alg.trading_chart.write_html(str_obj, 'html')
+    buf = str_obj.getvalue().encode()
+    aws_connections.put_s3_item(aws_connections.S3, chart_name, buf, 'text/html')
+
+    portfolio_chart_name = gen_random_string()
+    str_obj = StringIO()
+    alg.progress_chart.write_html(str_obj, 'html')
+    buf = str_obj.getvalue().encode()
+    aws_connections.put_s3_item(aws_connections.S3, portfolio_chart_name, buf, 'text/html')
+
+    dynamodb_item = dict()
+    dynamodb_item.update({
+        'algorithm': simulation["algorithm"],
+        'timestamp': datetime.datetime.now().strftime(timestamp_format),
+        'ticker': simulation["ticker"],
+        'period': simulation["period"],
+        'interval': simulation["interval"],
+    })
+    dynamodb_item.update(alg.simulation_stats)
+    dynamodb_item.update(simulation["parameters"])
+    dynamodb_item.update(simulation["engine_options"])
+
+    dynamodb_item = json.loads(json.dumps(dynamodb_item), parse_float=Decimal)
 
-        if alg is None:
-            return "The has been an error, check the configuration", 400
+    response = dict()
+    response.update(alg.simulation_stats)
+    response['trading_chart'] = aws_connections.get_s3_bucket_item_link(chart_name)
+    response['portfolio_evolution'] = aws_connections.get_s3_bucket_item_link(portfolio_chart_name)
 
-        alg.run_algorithm()
+    return response, dynamodb_item
 
-        chart_name = gen_random_string()
-        str_obj = StringIO()
-        alg.trading_chart.write_html(str_obj, 'html')
-        buf = str_obj.getvalue().encode()
-        aws_connections.put_s3_item(aws_connections.S3, chart_name, buf, 'text/html')
 
-        portfolio_chart_name = gen_random_string()
-        str_obj = StringIO()
-        alg.progress_chart.write_html(str_obj, 'html')
-        buf = str_obj.getvalue().encode()
-        aws_connections.put_s3_item(aws_connections.S3, portfolio_chart_name, buf, 'text/html')
+ALGO = Blueprint('algo', __name__)
+
+
+@ALGO.route('/simulate', methods=["POST"])
+@jwt_required()
+def simulate():
+    try:
+        simulation = prepare_simulation(dict(request.json))
 
-        dynamodb_item = dict()
-        dynamodb_item.update({
-            'algorithm': algorithm,
-            'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'ticker': ticker,
-            'period': period,
-            'interval': interval,
-        })
-        dynamodb_item.update(alg.simulation_stats)
-        dynamodb_item.update(algorithm_parameters)
+        cached_response = RESULT_CACHE.get(simulation["fingerprint"])
+        if cached_response is not None:
+            return jsonify(cached_response), 200
 
-        dynamodb_item = json.loads(json.dumps(dynamodb_item), parse_float=Decimal)
+        response, dynamodb_item = run_simulation(simulation)
 
         aws_connections.DYNAMODB_TABLE.put_item(
             TableName=aws_connections.DYNAMODB_RUNS_TABLE_NAME,
             Item=dynamodb_item
         )
 
+    except SimulationError as e:
+        return str(e), 400
+
     except Exception as e:
         print(e)
         return jsonify(e), 400
 
-    response = dict()
-    response.update(alg.simulation_stats)
-    response['trading_chart'] = aws_connections.get_s3_bucket_item_link(chart_name)
-    response['portfolio_evolution'] = aws_connections.get_s3_bucket_item_link(portfolio_chart_name)
+    RESULT_CACHE.put(simulation["fingerprint"], response, simulation["dependencies"])
+    return jsonify(response), 200
+
+
+def prefetch_market_data(specs):
+    keys = set()
+    for spec in specs:
+        period = spec.get("period", "12mo")
+        interval = spec.get("interval", "1d")
+        strategy = STRATEGIES.get(spec.get("algorithm"))
+        if period not in PERIODS or interval not in INTERVALS or strategy is None:
+            continue
+
+        try:
+            parameters = strategy.validate_parameters(spec)
+        except ValueError:
+            continue
+
+        # Intervals derived from the same download share it
+        source = resample_source(period, interval)
+        for data_ticker, _, _ in strategy.data_keys(spec.get("ticker", "AAPL"), period, interval, parameters):
+            keys.add((data_ticker, period, source))
+
+    # Every distinct series is downloaded once, the simulations then read it from the shared cache
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        for future in [executor.submit(get_market_data, *key) for key in keys]:
+            try:
+                future.result()
+            except Exception as e:
+                print(e)
+
+
+def run_batch_simulation(simulation):
+    cached_response = RESULT_CACHE.get(simulation["fingerprint"])
+    if cached_response is not None:
+        return cached_response, None
+
+    # Microseconds keep the sort keys of runs finishing in the same second apart
+    return run_simulation(simulation, "%Y-%m-%d %H:%M:%S.%f")
+
+
+@ALGO.route('/simulate/batch', methods=["POST"])
+@jwt_required()
+def simulate_batch():
+    specs = request.json.get("simulations") if isinstance(request.json, dict) else request.json
+
+    if not isinstance(specs, list) or len(specs) == 0 or not all(isinstance(spec, dict) for spec in specs):
+        return "The request must contain a non-empty list of simulations", 400
+
+    if len(specs) > BATCH_MAX_SIZE:
+        return "A batch can contain at most {size} simulations".format(size=BATCH_MAX_SIZE), 400
+
+    def generate():
+        prefetch_market_data(specs)
+
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            # Specs with the same fingerprint are simulated and stored once, every index gets the result
+            simulations = dict()
+            indices = defaultdict(list)
+            for index, future in [(index, executor.submit(prepare_simulation, spec)) for index, spec in enumerate(specs)]:
+                try:
+                    simulation = future.result()
+                except Exception as e:
+                    if not isinstance(e, SimulationError):
+                        print(e)
+                    yield json.dumps({"index": index, "error": str(e)}) + "\n"
+                    continue
+
+                simulations.setdefault(simulation["fingerprint"], simulation)
+                indices[simulation["fingerprint"]].append(index)
+
+            stored = 0
+            storage_error = None
+            try:
+                with aws_connections.DYNAMODB_TABLE.batch_writer(overwrite_by_pkeys=['algorithm', 'timestamp']) as batch:
+                    futures = {executor.submit(run_batch_simulation, simulation): fingerprint
+                               for fingerprint, simulation in simulations.items()}
+
+                    for future in as_completed(futures):
+                        fingerprint = futures[future]
+                        try:
+                            response, dynamodb_item = future.result()
+                            line = {"result": response}
+                        except SimulationError as e:
+                            dynamodb_item = None
+                            line = {"error": str(e)}
+                        except Exception as e:
+                            print(e)
+                            dynamodb_item = None
+                            line = {"error": str(e)}
+
+                        # Writes are buffered and flushed in groups, a failure is reported in the final status line
+                        if dynamodb_item is not None:
+                            RESULT_CACHE.put(fingerprint, response, simulations[fingerprint]["dependencies"])
+                            try:
+                                batch.put_item(Item=dynamodb_item)
+                                stored += 1
+                            except Exception as e:
+                                print(e)
+                                storage_error = str(e)
+
+                        for index in indices[fingerprint]:
+                            yield json.dumps({"index": index, **line}) + "\n"
+
+            # The last writes are only flushed when the writer is closed, after every result was sent
+            except Exception as e:
+                print(e)
+                storage_error = str(e)
+
+            if storage_error is None:
+                yield json.dumps({"status": "done", "stored": stored}) + "\n"
+            else:
+                yield json.dumps({"status": "error", "error": "The runs could not all be stored: " + storage_error}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+
+
+@ALGO.route('/robustness', methods=["POST"])
+@jwt_required()
+def robustness():
+    try:
+        data = dict(request.json)
+        simulation = prepare_simulation(data)
+
+        simulations = data.get("simulations", 1000)
+        block_size = data.get("block_size")
+        confidence = data.get("confidence", 0.95)
+        perturbation = data.get("perturbation", 0.1)
+        perturbations = data.get("perturbations", 0)
+
+        if not (type(simulations) is int and 0 < simulations <= ROBUSTNESS_MAX_SIMULATIONS):
+            return "The simulations must be an integer between 1 and {max}".format(max=ROBUSTNESS_MAX_SIMULATIONS), 400
+
+        if block_size is not None and not (type(block_size) is int and block_size > 0):
+            return "The block size must be strictly positive integer", 400
+
+        if not ((type(confidence) is int or type(confidence) is float) and 0 < confidence < 1):
+            return "The confidence must be a number between 0 and 1", 400
+
+        if not ((type(perturbation) is int or type(perturbation) is float) and 0 <= perturbation < 1):
+            return "The perturbation must be a number between 0 and 1", 400
+
+        if not (type(perturbations) is int and 0 <= perturbations <= ROBUSTNESS_MAX_PERTURBATIONS):
+            return "The perturbations must be an integer between 0 and {max}".format(max=ROBUSTNESS_MAX_PERTURBATIONS), 400
+
+        response = run_robustness(simulation["alg"], simulations, block_size, confidence, simulation["parameters"],
+                                  perturbation, perturbations, simulation["engine"])
+
+    except SimulationError as e:
+        return str(e), 400
+
+    except Exception as e:
+        print(e)
+        return str(e), 400
+
+    response.update(simulation["parameters"])
+    response.update(simulation["engine_options"])
     return jsonify(response), 200
 
 
@@ -259,15 +491,12 @@ def get_average(key, items):
 def get_most_popular_config(algorithm, items):
     most_popular_config = dict()
 
-    if algorithm == "mean_reversion":
-        most_popular_config["time_window"] = get_most_used("time_window", items)
-    elif algorithm == "double_rsi":
-        most_popular_config["rsi_long_period"] = get_most_used("rsi_long_period", items)
-        most_popular_config["rsi_short_period"] = get_most_used("rsi_short_period", items)
-    elif algorithm == "arbitrage":
-        most_popular_config["entry_threshold"] = get_most_used("entry_threshold", items)
-        most_popular_config["exit_threshold"] = get_most_used("exit_threshold", items)
-        most_popular_config["ticker2"] = get_most_used("ticker2", items)
+    if algorithm not in STRATEGIES:
+        return most_popular_config
+
+    for name in STRATEGIES[algorithm].PARAMETERS:
+        if any(name in item for item in items):
+            most_popular_config[name] = get_most_used(name, items)
 
     return most_popular_config
 
@@ -0,0 +1,221 @@
+import heapq
+
+import numpy as np
+
+# Intra-bar triggers are processed before the signals evaluated on the close of the same bar,
+# pending orders expire after both
+INTRABAR, CLOSE, EXPIRY = 0, 1, 2
+
+SIGNAL = 'signal'
+EXIT = 'exit'
+ENTRY = 'entry'
+EXPIRE = 'expire'
+
+SCAN_CHUNK = 256
+
+# Position value closing the current position without taking the other side, 0 keeps it
+FLATTEN = 2
+
+
+class Order:
+    __slots__ = ('bar', 'side', 'price', 'expires')
+
+    def __init__(self, bar, side, price, expires):
+        self.bar = bar
+        self.side = side
+        self.price = price
+        self.expires = expires
+
+
+class Fill:
+    __slots__ = ('bar', 'side', 'price', 'reason')
+
+    def __init__(self, bar, side, price, reason):
+        self.bar = bar
+        self.side = side
+        self.price = price
+        self.reason = reason
+
+
+class Bars:
+    __slots__ = ('open', 'high', 'low', 'close', 'length')
+
+    def __init__(self, open_, high, low, close):
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.length = len(self.close)
+
+    # First bar in [start, stop) where the low reaches `below` or the high reaches `above`,
+    # scanned in growing chunks so a trigger close to `start` doesn't pay for the whole range
+    def first_touch(self, start, stop, below=-np.inf, above=np.inf):
+        chunk = SCAN_CHUNK
+        while start < stop:
+            end = min(stop, start + chunk)
+            hits = np.flatnonzero((self.low[start:end] <= below) | (self.high[start:end] >= above))
+            if hits.size:
+                return start + int(hits[0])
+            start = end
+            chunk *= 2
+        return -1
+
+
+def realized_equity(bars, values, length):
+    # Step curve holding the equity reached at each bar in `bars` until the next one
+    if len(bars) == 0:
+        return np.ones(length)
+    last = np.searchsorted(bars, np.arange(length), side='right') - 1
+    return np.where(last >= 0, np.asarray(values, dtype=np.float64)[np.maximum(last, 0)], 1.0)
+
+
+class EventEngine:
+    def __init__(self, stop_loss=None, take_profit=None, limit_offset=None, limit_ttl=None):
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.limit_offset = limit_offset
+        self.limit_ttl = limit_ttl
+
+    def run(self, alg):
+        if alg.market_data is None:
+            raise ValueError("The event engine needs a single OHLC series to trade on")
+
+        bars = Bars(alg.market_data['Open'], alg.market_data['High'], alg.market_data['Low'],
+                    alg.market_data['Close'])
+        fills, equity = self.simulate(bars, alg.data['Position'].to_numpy())
+
+        index = alg.data.index
+        for fill in fills:
+            alg.trades["time"].append(index[fill.bar])
+            alg.trades["price"].append(fill.price)
+            alg.trades["mode"].append(fill.side)
+        alg.cumulative_returns = equity
+
+    def simulate(self, bars, positions):
+        positions = np.asarray(positions)
+        changes = np.flatnonzero(np.diff(positions, prepend=0) != 0)
+
+        queue = [(int(bar), CLOSE, int(bar), SIGNAL, int(positions[bar])) for bar in changes]
+        heapq.heapify(queue)
+        sequence = bars.length
+
+        position = 0
+        entry_price = 0.0
+        pending = None
+        stops = None
+        current_sum = 1.0
+
+        # Events scheduled for a state that no longer exists carry an older version and are skipped
+        version = 0
+        fills = list()
+        exit_bars = list()
+        exit_equity = list()
+
+        def close_position(bar, price, side, reason):
+            nonlocal position, current_sum, stops, version
+            current_sum = current_sum * ((price / entry_price) ** position)
+            exit_bars.append(bar)
+            exit_equity.append(current_sum)
+            fills.append(Fill(bar, side, price, reason))
+            position = 0
+            stops = None
+            version += 1
+
+        def open_position(bar, side, price, reason, record=True):
+            nonlocal position, entry_price, stops, version
+            position = side
+            entry_price = price
+            stops = (
+                price * (1 - side * self.stop_loss) if self.stop_loss else None,
+                price * (1 + side * self.take_profit) if self.take_profit else None
+            )
+            if record:
+                fills.append(Fill(bar, side, price, reason))
+            version += 1
+
+        def enter(bar, side):
+            nonlocal pending, version
+            price = bars.close[bar]
+            if self.limit_offset:
+                expires = bar + self.limit_ttl if self.limit_ttl else bars.length - 1
+                pending = Order(bar, side, price * (1 - side * self.limit_offset), min(expires, bars.length - 1))
+                version += 1
+            else:
+                open_position(bar, side, price, SIGNAL)
+
+        while queue:
+            bar, priority, _, kind, value = heapq.heappop(queue)
+
+            if kind == SIGNAL:
+                if value == FLATTEN:
+                    if position != 0:
+                        close_position(bar, bars.close[bar], 0, SIGNAL)
+                    elif pending is not None:
+                        pending = None
+                        version += 1
+
+                # 0 holds and a repeated side keeps the pending order, only limit_ttl expires it
+                elif value == 0 or (pending is not None and pending.side == value):
+                    pass
+
+                elif position == -value:
+                    if self.limit_offset:
+                        close_position(bar, bars.close[bar], 0, SIGNAL)
+                        enter(bar, value)
+                    else:
+                        # Reversal at the close, recorded as a single trade like the vectorized path
+                        close_position(bar, bars.close[bar], value, SIGNAL)
+                        open_position(bar, value, bars.close[bar], SIGNAL, record=False)
+                elif position == 0:
+                    # Replaces a pending order for the other side, entering bumps the version
+                    pending = None
+                    enter(bar, value)
+
+            elif value != version:
+                pass
+
+            elif kind == EXIT:
+                stop, take = stops
+                if stop is not None and (bars.low[bar] <= stop if position > 0 else bars.high[bar] >= stop):
+                    price = min(bars.open[bar], stop) if position > 0 else max(bars.open[bar], stop)
+                    close_position(bar, price, 0, 'stop_loss')
+                else:
+                    price = max(bars.open[bar], take) if position > 0 else min(bars.open[bar], take)
+                    close_position(bar, price, 0, 'take_profit')
+
+            elif kind == ENTRY:
+                order = pending
+                pending = None
+                price = min(bars.open[bar], order.price) if order.side > 0 else max(bars.open[bar], order.price)
+                open_position(bar, order.side, price, 'limit')
+
+            elif kind == EXPIRE:
+                pending = None
+                version += 1
+
+            # Look for the next intra-bar trigger up to the next queued event, later bars are
+            # scanned once that event has been processed
+            horizon = min(queue[0][0] + 1, bars.length) if queue else bars.length
+
+            if position != 0 and stops is not None and any(level is not None for level in stops):
+                stop, take = stops
+                if position > 0:
+                    below, above = (stop if stop is not None else -np.inf), (take if take is not None else np.inf)
+                else:
+                    below, above = (take if take is not None else -np.inf), (stop if stop is not None else np.inf)
+
+                touched = bars.first_touch(bar + 1, horizon, below, above)
+                if touched >= 0:
+                    sequence += 1
+                    heapq.heappush(queue, (touched, INTRABAR, sequence, EXIT, version))
+
+            elif pending is not None:
+                below, above = (pending.price, np.inf) if pending.side > 0 else (-np.inf, pending.price)
+                touched = bars.first_touch(bar + 1, min(horizon, pending.expires + 1), below, above)
+                sequence += 1
+                if touched >= 0:
+                    heapq.heappush(queue, (touched, INTRABAR, sequence, ENTRY, version))
+                elif pending.expires < horizon:
+                    heapq.heappush(queue, (pending.expires, EXPIRY, sequence, EXPIRE, version))
+
+        return fills, realized_equity(np.asarray(exit_bars, dtype=np.int64), exit_equity, bars.length)
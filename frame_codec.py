@@ -0,0 +1,216 @@
+import hashlib
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from market_data import market_data_config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+FRAME_MAGIC = b'OHLCV\x01'
+CHUNKS_MAGIC = b'CHUNKS\x01'
+HEADER_LENGTH = struct.Struct('<I')
+
+NS_PER_SECOND = 10 ** 9
+
+# memcached refuses items over 1 MB, the rest of the item is left for the key and its flags
+MEMCACHE_ITEM_SIZE = 1024 * 1024
+CHUNK_SIZE = MEMCACHE_ITEM_SIZE - 1024
+
+COMPRESSORS = {'zlib': (lambda data: zlib.compress(data, 1), zlib.decompress)}
+if lz4 is not None:
+    COMPRESSORS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+if zstandard is not None:
+    COMPRESSORS['zstd'] = (
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data)
+    )
+
+# Best codec installed unless the configuration picks one
+DEFAULT_COMPRESSION = market_data_config.get("cache_compression") or next(
+    name for name in ['zstd', 'lz4', 'zlib'] if name in COMPRESSORS
+)
+
+
+# The n-th bytes of all the values are stored together, the exponents and high bytes of
+# neighbouring prices are then long runs the compressor picks up
+def shuffle(values):
+    return np.ascontiguousarray(values).view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def unshuffle(buffer, dtype, rows):
+    return np.frombuffer(buffer, np.uint8).reshape(dtype.itemsize, rows).T.copy().view(dtype).ravel()
+
+
+def smallest_int_dtype(values):
+    if len(values) == 0:
+        return np.dtype(np.int8)
+    return np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+
+
+def encode_index(index):
+    index = pd.DatetimeIndex(index)
+    tz = str(index.tz) if index.tz is not None else None
+    ns = (index.tz_convert(None) if tz else index).to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+    # Bars are evenly spaced, the deltas between them are a handful of distinct small numbers
+    unit = NS_PER_SECOND if not (ns % NS_PER_SECOND).any() else 1
+    ticks = ns // unit
+    deltas = np.diff(ticks, prepend=ticks[:1])
+    dtype = smallest_int_dtype(deltas)
+
+    meta = {
+        "name": index.name,
+        "tz": tz,
+        "start": int(ticks[0]) if len(ticks) else 0,
+        "unit": unit,
+        "dtype": dtype.str
+    }
+    return meta, shuffle(deltas.astype(dtype))
+
+
+def decode_index(meta, buffer, rows):
+    deltas = unshuffle(buffer, np.dtype(meta["dtype"]), rows)
+    ns = (meta["start"] + np.cumsum(deltas, dtype=np.int64)) * meta["unit"]
+
+    index = pd.DatetimeIndex(ns.astype('datetime64[ns]'), name=meta["name"])
+    return index.tz_localize('UTC').tz_convert(meta["tz"]) if meta["tz"] else index
+
+
+def encode_frame(frame, dtype=None, compression=None):
+    compression = compression or DEFAULT_COMPRESSION
+    index_meta, index_buffer = encode_index(frame.index)
+
+    columns = list()
+    buffers = [index_buffer]
+    for name in frame.columns:
+        values = frame[name].to_numpy()
+        if values.dtype.kind not in 'biuf':
+            raise TypeError("The column {name} is not numeric".format(name=name))
+
+        # Integer volumes stay exact, only the floating point columns are narrowed
+        if dtype is not None and values.dtype.kind == 'f':
+            values = values.astype(dtype)
+        columns.append({"name": name, "dtype": values.dtype.str})
+        buffers.append(shuffle(values))
+
+    header = json.dumps({
+        "rows": len(frame),
+        "compression": compression,
+        "index": index_meta,
+        "columns": columns,
+        "column_names": list(frame.columns.names)
+    }, separators=(',', ':')).encode()
+
+    compress, _ = COMPRESSORS[compression]
+    return FRAME_MAGIC + HEADER_LENGTH.pack(len(header)) + header + compress(b''.join(buffers))
+
+
+def is_encoded_frame(data):
+    return isinstance(data, bytes) and data.startswith(FRAME_MAGIC)
+
+
+def decode_frame(data):
+    offset = len(FRAME_MAGIC)
+    (header_length,) = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + header_length])
+
+    _, decompress = COMPRESSORS[header["compression"]]
+    body = memoryview(decompress(data[offset + header_length:]))
+    rows = header["rows"]
+
+    index_meta = header["index"]
+    position = rows * np.dtype(index_meta["dtype"]).itemsize
+    index = decode_index(index_meta, body[:position], rows)
+
+    names = list()
+    values = list()
+    for column in header["columns"]:
+        dtype = np.dtype(column["dtype"])
+        size = rows * dtype.itemsize
+        values.append(unshuffle(body[position:position + size], dtype, rows))
+        position += size
+
+        # JSON turns the tuples of multi-level column labels into lists
+        name = column["name"]
+        names.append(tuple(name) if isinstance(name, list) else name)
+
+    # Level names, like the Price and Ticker levels of recent yfinance downloads
+    column_names = header["column_names"]
+    if any(isinstance(name, tuple) for name in names):
+        labels = pd.MultiIndex.from_tuples(names, names=column_names)
+    else:
+        labels = pd.Index(names, dtype=object, name=column_names[0])
+    return pd.DataFrame(dict(zip(range(len(values)), values)), index=index).set_axis(labels, axis=1)
+
+
+def chunk_key(key, token, number):
+    return '{key}:{token}:{number}'.format(key=key, token=token, number=number)
+
+
+# Values over the memcached item limit are split, the chunk keys carry a hash of the value so
+# chunks of an older value under the same key are never mixed with the new ones
+def set_chunked(memcache, key, data, ttl):
+    if len(data) <= CHUNK_SIZE:
+        memcache.set(key, data, ttl)
+        return
+
+    token = hashlib.blake2b(data, digest_size=8).hexdigest()
+    chunks = range(0, len(data), CHUNK_SIZE)
+    for number, start in enumerate(chunks):
+        memcache.set(chunk_key(key, token, number), data[start:start + CHUNK_SIZE], ttl)
+
+    # The manifest is written last, a reader never finds it before all the chunks
+    manifest = json.dumps({"token": token, "chunks": len(chunks), "size": len(data)}).encode()
+    memcache.set(key, CHUNKS_MAGIC + manifest, ttl)
+
+
+def get_chunked(memcache, key):
+    data = memcache.get(key)
+    if not isinstance(data, bytes) or not data.startswith(CHUNKS_MAGIC):
+        return data
+
+    manifest = json.loads(data[len(CHUNKS_MAGIC):])
+    chunks = [memcache.get(chunk_key(key, manifest["token"], number)) for number in range(manifest["chunks"])]
+
+    # Chunks are evicted independently, a missing one makes the whole value a miss
+    if not all(isinstance(chunk, bytes) for chunk in chunks):
+        return None
+    data = b''.join(chunks)
+    return data if len(data) == manifest["size"] else None
+
+
+def get_frame(memcache, key):
+    data = get_chunked(memcache, key)
+    # Frames pickled by older versions are downloaded again
+    if not is_encoded_frame(data):
+        return None
+
+    # A truncated value or one compressed with a codec this instance lacks is a miss as well
+    try:
+        return decode_frame(data)
+    except Exception as e:
+        print(e)
+        return None
+
+
+def set_frame(memcache, key, frame, ttl, dtype=None):
+    # A frame the codec cannot store is simply not cached, the request still uses it
+    try:
+        data = encode_frame(frame, dtype)
+    except TypeError as e:
+        print(e)
+        return
+    set_chunked(memcache, key, data, ttl)
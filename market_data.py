@@ -0,0 +1,202 @@
+import configparser
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+config = configparser.RawConfigParser()
+config.read('config.ini')
+market_data_config = dict(config.items('market_data')) if config.has_section('market_data') else dict()
+
+MARKET_DATA_DTYPE = np.dtype(market_data_config.get("dtype", "float64"))
+MARKET_DATA_DIR = market_data_config.get("cache_dir") or None
+MARKET_DATA_TTL = 12 * 60 * 60
+MARKET_DATA_MAX_ENTRIES = 256
+
+
+def read_only(array):
+    array = np.asarray(array)
+    if array.flags.writeable:
+        array.setflags(write=False)
+    return array
+
+
+# Read-only OHLCV block shared between concurrent simulations, strategies keep their
+# derived columns in their own frame so one copy of the prices serves every run
+class MarketData:
+    def __init__(self, index, columns):
+        self.index = index
+        self.columns = {name: read_only(values) for name, values in columns.items()}
+        self._version = None
+        self.resampled = dict()
+
+    @classmethod
+    def from_frame(cls, frame, dtype=MARKET_DATA_DTYPE):
+        if isinstance(frame, MarketData):
+            return frame
+
+        columns = dict()
+        for name in OHLCV_COLUMNS:
+            if name in frame:
+                columns[name] = frame[name].to_numpy(dtype=dtype, copy=True)
+            else:
+                columns[name] = np.full(len(frame), np.nan, dtype=dtype)
+        return cls(frame.index, columns)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        index = pd.DatetimeIndex(np.load(os.path.join(path, 'index.npy')), name=meta["index_name"])
+        index = index.tz_localize('UTC').tz_convert(meta["tz"]) if meta["tz"] else index
+
+        columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in meta["columns"]}
+        return cls(index, columns)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        index = pd.DatetimeIndex(self.index)
+        tz = str(index.tz) if index.tz is not None else None
+
+        np.save(os.path.join(path, 'index.npy'), (index.tz_convert(None) if tz else index).to_numpy())
+        for name, values in self.columns.items():
+            np.save(os.path.join(path, name + '.npy'), values)
+
+        # Written last, a directory without it is treated as incomplete
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({"columns": list(self.columns), "tz": tz, "index_name": index.name}, f)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def empty(self):
+        return len(self.index) == 0
+
+    # Content hash, it only changes when a refresh brings different bars
+    @property
+    def version(self):
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(pd.DatetimeIndex(self.index).asi8.tobytes())
+            for name in sorted(self.columns):
+                digest.update(name.encode())
+                digest.update(np.ascontiguousarray(self.columns[name]).tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values()) + self.index.nbytes
+
+    def slice(self, start, stop):
+        return MarketData(self.index[start:stop], {name: values[start:stop] for name, values in self.columns.items()})
+
+    def series(self, column):
+        return pd.Series(self.columns[column], index=self.index, name=column, copy=False)
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.series(name) for name in self.columns}, index=self.index)
+
+
+# On disk every refresh is written to a new version directory and published by atomically replacing
+# the `current` pointer file, arrays other processes have memory-mapped are never rewritten
+class MarketDataCache:
+    def __init__(self, directory=MARKET_DATA_DIR, ttl=MARKET_DATA_TTL, max_entries=MARKET_DATA_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = dict()
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def pointer_path(self, key):
+        return os.path.join(self.path(key), 'current')
+
+    def remember(self, key, created, market_data):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (created, market_data)
+
+            # Expired entries go first, then the oldest ones until the cache is back under its bound
+            now = time.time()
+            for expired in [name for name, entry in self.entries.items() if now - entry[0] >= self.ttl]:
+                del self.entries[expired]
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+
+        if self.directory is None:
+            return None
+
+        # Another worker process may have already written the arrays to disk
+        try:
+            created = os.path.getmtime(self.pointer_path(key))
+            with open(self.pointer_path(key)) as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        if time.time() - created >= self.ttl:
+            return None
+
+        market_data = MarketData.load(os.path.join(self.path(key), version))
+        self.remember(key, created, market_data)
+        return market_data
+
+    def put(self, key, market_data):
+        if self.directory is not None and not market_data.empty:
+            version = '{time}-{pid}-{thread}'.format(time=time.time_ns(), pid=os.getpid(), thread=threading.get_ident())
+            market_data.save(os.path.join(self.path(key), version))
+            market_data = MarketData.load(os.path.join(self.path(key), version))
+
+            pointer = self.pointer_path(key) + '.' + version
+            with open(pointer, 'w') as f:
+                f.write(version)
+            os.replace(pointer, self.pointer_path(key))
+            self.remove_versions(key, keep=version)
+
+        self.remember(key, time.time(), market_data)
+        return market_data
+
+    def remove_versions(self, key, keep):
+        # Only expired versions are removed, a recent one may still be written or loaded by another process.
+        # Unlinking a mapped file leaves the mapping valid, readers of an older version are unaffected
+        now = time.time()
+        for name in os.listdir(self.path(key)):
+            path = os.path.join(self.path(key), name)
+            if name != keep and os.path.isdir(path) and now - os.path.getmtime(path) >= self.ttl:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+        if self.directory is not None:
+            try:
+                os.remove(self.pointer_path(key))
+            except FileNotFoundError:
+                pass
+
+
+MARKET_DATA_CACHE = MarketDataCache()
@@ -0,0 +1,163 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from market_data import MarketData
+
+SESSION_OPEN_HOUR = 9.5
+SESSION_CLOSE_HOUR = 16
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+SESSION_OPEN_NS = int(SESSION_OPEN_HOUR * 60) * NS_PER_MINUTE
+
+INTRADAY_UNIT_MINUTES = {
+    'm': 1,
+    'h': 60
+}
+
+PERIOD_UNIT_DAYS = {
+    'd': 1,
+    'mo': 31,
+    'y': 366
+}
+
+# Finest interval Yahoo serves for a period of at most that many days, the coarser intraday
+# intervals it divides are derived from it instead of being downloaded separately
+BASE_INTERVALS = [
+    (7, '1m'),
+    (60, '5m'),
+    (730, '1h'),
+    (math.inf, '1d')
+]
+
+# Intervals Yahoo serves, the only ones the endpoints and the strategy parameters accept
+INTERVALS = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo']
+CALENDAR_INTERVALS = ['1d', '5d', '1wk', '1mo', '3mo']
+
+
+def interval_minutes(interval):
+    time = re.split(r'(\d+)', interval)
+    unit = time[-1]
+
+    if unit not in INTRADAY_UNIT_MINUTES:
+        return None
+    return int(time[1]) * INTRADAY_UNIT_MINUTES[unit]
+
+
+def period_days(period):
+    if period == 'ytd':
+        return PERIOD_UNIT_DAYS['y']
+    if period == 'max':
+        return math.inf
+
+    time = re.split(r'(\d+)', period)
+    return int(time[1]) * PERIOD_UNIT_DAYS[time[-1]]
+
+
+def base_interval(period):
+    days = period_days(period)
+    return next(interval for max_days, interval in BASE_INTERVALS if days <= max_days)
+
+
+def can_resample(source, target):
+    if source == target:
+        return True
+
+    source_minutes = interval_minutes(source)
+    target_minutes = interval_minutes(target)
+
+    if source_minutes is None:
+        return source == '1d' and target in CALENDAR_INTERVALS
+    if target_minutes is None:
+        return target in CALENDAR_INTERVALS
+    return target_minutes > source_minutes and target_minutes % source_minutes == 0
+
+
+def resample_source(period, interval):
+    # Daily and coarser bars come from the daily download, the last intraday bar of a session
+    # misses the closing auction so its close and volume differ from the official daily ones
+    if interval_minutes(interval) is None:
+        return '1d' if can_resample('1d', interval) else interval
+
+    base = base_interval(period)
+    return base if can_resample(base, interval) else interval
+
+
+# Wall clock time of the exchange in nanoseconds, sessions are aligned on it
+def local_ns(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+
+def bar_labels(index, interval):
+    ns = local_ns(index)
+    days = ns - ns % NS_PER_DAY
+    minutes = interval_minutes(interval)
+
+    if minutes is not None:
+        # Bins start at the session open of each day, so nothing spans the overnight gap
+        step = minutes * NS_PER_MINUTE
+        return days + SESSION_OPEN_NS + np.floor_divide(ns - days - SESSION_OPEN_NS, step) * step
+
+    if interval == '1d':
+        return days
+
+    if interval == '5d':
+        day_number = np.cumsum(np.r_[True, days[1:] != days[:-1]]) - 1
+        group = day_number // 5
+        firsts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        return days[firsts][group]
+
+    if interval == '1wk':
+        # The epoch is a Thursday, weeks start on Monday like the ones from Yahoo
+        return days - ((days // NS_PER_DAY + 3) % 7) * NS_PER_DAY
+
+    months = days.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    if interval == '3mo':
+        months = months - months % 3
+    return months.astype('datetime64[M]').astype('datetime64[ns]').astype(np.int64)
+
+
+def resample(market_data, interval):
+    if interval in market_data.resampled:
+        return market_data.resampled[interval]
+
+    labels = bar_labels(market_data.index, interval)
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(labels) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(labels)] - 1
+
+    index = pd.DatetimeIndex(labels[starts].astype('datetime64[ns]'), name=market_data.index.name)
+    tz = pd.DatetimeIndex(market_data.index).tz
+    if tz is not None and interval_minutes(interval) is not None:
+        index = index.tz_localize(tz)
+
+    columns = dict()
+    if len(starts):
+        columns['Open'] = market_data['Open'][starts]
+        columns['High'] = np.fmax.reduceat(market_data['High'], starts)
+        columns['Low'] = np.fmin.reduceat(market_data['Low'], starts)
+        columns['Close'] = market_data['Close'][ends]
+        columns['Volume'] = np.add.reduceat(np.nan_to_num(market_data['Volume']), starts)
+    else:
+        columns = {name: market_data[name][:0] for name in market_data.columns}
+
+    resampled = MarketData(index, columns)
+    market_data.resampled[interval] = resampled
+    return resampled
+
+
+def align(values, coarse_index, fine_index):
+    # Every fine bar sees the last coarse bar that had already closed, never the one it is part of
+    coarse = local_ns(coarse_index)
+    fine = local_ns(fine_index)
+    previous = np.searchsorted(coarse, fine, side='right') - 2
+
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.full(len(fine), np.nan)
+    return np.where(previous >= 0, values[np.maximum(previous, 0)], np.nan)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+
+RESULT_TTL = 12 * 60 * 60
+# Seconds between two sweeps of the expired fingerprints
+RESULT_PRUNE_INTERVAL = 60
+
+
+def request_fingerprint(algorithm, ticker, period, interval, algorithm_parameters, data_versions):
+    payload = json.dumps({
+        "algorithm": algorithm,
+        "ticker": ticker,
+        "period": period,
+        "interval": interval,
+        "parameters": algorithm_parameters,
+        "data": data_versions
+    }, sort_keys=True, separators=(',', ':'))
+
+    return 'result' + hashlib.sha256(payload.encode()).hexdigest()
+
+
+# Results are stored in memcached when it is available so every instance can reuse them,
+# the data versions are part of the fingerprint so a result is never served for other bars
+class ResultCache:
+    def __init__(self, memcache=None, ttl=RESULT_TTL):
+        self.memcache = memcache
+        self.ttl = ttl
+        self.entries = dict()
+        # Data key -> fingerprint -> time it was stored, fingerprints older than the TTL are swept
+        self.fingerprints = defaultdict(dict)
+        self.pruned = time.time()
+        self.lock = threading.Lock()
+
+    def get(self, fingerprint):
+        if self.memcache is not None:
+            return self.memcache.get(fingerprint)
+
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    def put(self, fingerprint, result, data_keys):
+        now = time.time()
+        with self.lock:
+            for data_key in data_keys:
+                self.fingerprints[data_key][fingerprint] = now
+            if self.memcache is None:
+                self.entries[fingerprint] = (now, result)
+            if now - self.pruned >= RESULT_PRUNE_INTERVAL:
+                self.prune(now)
+
+        if self.memcache is not None:
+            self.memcache.set(fingerprint, result, self.ttl)
+
+    # Expired results are gone from memcached as well, nothing is left to invalidate for them
+    def prune(self, now):
+        for data_key in list(self.fingerprints):
+            fingerprints = self.fingerprints[data_key]
+            for fingerprint in [fingerprint for fingerprint, stored in fingerprints.items() if now - stored >= self.ttl]:
+                del fingerprints[fingerprint]
+            if not fingerprints:
+                del self.fingerprints[data_key]
+
+        for fingerprint in [fingerprint for fingerprint, entry in self.entries.items() if now - entry[0] >= self.ttl]:
+            del self.entries[fingerprint]
+        self.pruned = now
+
+    def invalidate(self, data_key):
+        with self.lock:
+            fingerprints = self.fingerprints.pop(data_key, dict())
+            for fingerprint in fingerprints:
+                self.entries.pop(fingerprint, None)
+
+        if self.memcache is not None:
+            for fingerprint in fingerprints:
+                self.memcache.delete(fingerprint)
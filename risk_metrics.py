@@ -0,0 +1,169 @@
+import re
+import warnings
+
+import numpy as np
+
+TRADING_DAYS = 252
+TRADING_MINUTES_PER_DAY = 390
+
+INTERVAL_TO_PERIODS_PER_YEAR = {
+    'm': TRADING_DAYS * TRADING_MINUTES_PER_DAY,
+    'h': TRADING_DAYS * TRADING_MINUTES_PER_DAY / 60,
+    'd': TRADING_DAYS,
+    'wk': 52,
+    'mo': 12
+}
+
+VAR_CONFIDENCE = 0.95
+
+# Risk free rate the Sharpe and Sortino ratios reported by the application are measured against
+RFR_ANNUAL = 0.05
+
+
+def periods_per_year(interval):
+    time = re.split(r'(\d+)', interval)
+    num = int(time[1])
+    unit = time[-1]
+
+    return INTERVAL_TO_PERIODS_PER_YEAR[unit] / num
+
+
+def as_result(value):
+    return value.item() if np.ndim(value) == 0 else value
+
+
+# All the metrics work on the last axis, so a (combinations, bars) matrix of equity curves
+# is evaluated in one call and each metric comes back as an array with one value per curve
+def compute_returns(equity):
+    equity = np.asarray(equity, dtype=np.float64)
+    return equity[..., 1:] / equity[..., :-1] - 1
+
+
+def sharpe_ratio(returns, interval, rfr_annual=0.0):
+    ppy = periods_per_year(interval)
+    excess_return = returns - ((1 + rfr_annual) ** (1 / ppy) - 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return excess_return.mean(axis=-1) / excess_return.std(axis=-1) * np.sqrt(ppy)
+
+
+def sortino_ratio(returns, interval, rfr_annual=0.0):
+    ppy = periods_per_year(interval)
+    excess_return = returns - ((1 + rfr_annual) ** (1 / ppy) - 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside_deviation = np.nanstd(np.where(excess_return < 0, excess_return, np.nan), axis=-1)
+        return excess_return.mean(axis=-1) / downside_deviation * np.sqrt(ppy)
+
+
+def rolling_sharpe(returns, interval, window, rfr_annual=0.0):
+    ppy = periods_per_year(interval)
+    excess_return = returns - ((1 + rfr_annual) ** (1 / ppy) - 1)
+
+    pad = [(0, 0)] * (excess_return.ndim - 1) + [(1, 0)]
+    sums = np.cumsum(np.pad(excess_return, pad), axis=-1)
+    squares = np.cumsum(np.pad(excess_return ** 2, pad), axis=-1)
+
+    mean = (sums[..., window:] - sums[..., :-window]) / window
+    variance = np.maximum((squares[..., window:] - squares[..., :-window]) / window - mean ** 2, 0)
+
+    # Windows where the returns never change have no deviation, rounding in the sums would make one up
+    changes = np.cumsum(np.pad(excess_return[..., 1:] != excess_return[..., :-1], pad), axis=-1)
+    flat = changes[..., window - 1:] == changes[..., :max(excess_return.shape[-1] - window + 1, 0)]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(flat, np.nan, mean / np.sqrt(variance) * np.sqrt(ppy))
+
+    nan_pad = np.full(excess_return.shape[:-1] + (min(window - 1, excess_return.shape[-1]),), np.nan)
+    return np.concatenate([nan_pad, sharpe], axis=-1)
+
+
+# About a quarter of bars, fewer on short histories so there are still several windows
+def rolling_window(interval, length):
+    return int(max(2, min(periods_per_year(interval) / 4, length // 4)))
+
+
+def nan_reduce(function, values):
+    if values.shape[-1] == 0:
+        return np.full(values.shape[:-1], np.nan)
+    return function(values, axis=-1)
+
+
+def positive_share(values, axis=-1):
+    return (values > 0).sum(axis=axis) / np.isfinite(values).sum(axis=axis)
+
+
+def drawdown(equity):
+    equity = np.asarray(equity, dtype=np.float64)
+    peak = np.maximum.accumulate(equity, axis=-1)
+    drawdowns = equity / peak - 1
+
+    # Bars elapsed since the last time the curve was at its peak
+    bars = np.broadcast_to(np.arange(equity.shape[-1]), equity.shape)
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, bars, 0), axis=-1)
+
+    return drawdowns.min(axis=-1), (bars - last_peak).max(axis=-1)
+
+
+# Losses are reported as positive numbers, NaN values are ignored
+def value_at_risk(returns, confidence=VAR_CONFIDENCE):
+    if returns.shape[-1] == 0:
+        nan = np.full(returns.shape[:-1], np.nan)
+        return nan, nan
+
+    quantile = np.nanquantile(returns, 1 - confidence, axis=-1)
+    tail = np.where(returns <= quantile[..., np.newaxis], returns, np.nan)
+
+    # Subtracting from 0.0 gives 0.0 rather than -0.0 for a zero quantile
+    with np.errstate(invalid='ignore'):
+        return 0.0 - quantile, 0.0 - np.nanmean(tail, axis=-1)
+
+
+# `trades` holds the entry and exit bar of every trade of a single curve. Without it every change of
+# the curve counts as one, which only holds for curves that move when a position is closed
+def compute_metrics(equity, interval, rfr_annual=0.0, trades=None):
+    equity = np.asarray(equity, dtype=np.float64)
+    returns = compute_returns(equity)
+    ppy = periods_per_year(interval)
+
+    if trades is not None:
+        trades = np.asarray(trades, dtype=np.int64).reshape(-1, 2)
+        trade_pnl = equity[trades[:, 1]] / equity[trades[:, 0]] - 1
+    else:
+        # The first bar is compared to the starting 1
+        previous = np.concatenate([np.ones(equity.shape[:-1] + (1,)), equity[..., :-1]], axis=-1)
+        trade_pnl = equity / previous - 1
+        trade_pnl = np.where(trade_pnl != 0, trade_pnl, np.nan)
+    profitable = (trade_pnl > 0).sum(axis=-1)
+    trades = np.isfinite(trade_pnl).sum(axis=-1)
+
+    strategy_result = equity[..., -1] - 1
+    max_drawdown, max_drawdown_duration = drawdown(equity)
+
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        # Per trade, the equity only moves when a trade is closed so most bar returns are 0
+        var, cvar = value_at_risk(trade_pnl)
+        rolling = rolling_sharpe(returns, interval, rolling_window(interval, returns.shape[-1]), rfr_annual)
+        annual_return = (1 + strategy_result) ** (ppy / max(returns.shape[-1], 1)) - 1
+
+        metrics = {
+            "Profitable trades": profitable,
+            "Strategy Result": strategy_result,
+            "Max Profit": np.nanmax(equity, axis=-1) - 1,
+            "Max Loss": np.nanmin(equity, axis=-1) - 1,
+            "Sharpe ratio": sharpe_ratio(returns, interval, rfr_annual),
+            "Sortino ratio": sortino_ratio(returns, interval, rfr_annual),
+            "Median rolling Sharpe ratio": nan_reduce(np.nanmedian, rolling),
+            "Positive rolling Sharpe ratio share": nan_reduce(positive_share, rolling),
+            "Max Drawdown": max_drawdown,
+            "Max Drawdown Duration": max_drawdown_duration,
+            "Calmar ratio": annual_return / np.abs(max_drawdown),
+            "Value at Risk": var,
+            "Conditional Value at Risk": cvar,
+            "Win rate": profitable / trades,
+            "Average trade P&L": np.nansum(trade_pnl, axis=-1) / trades
+        }
+
+    return {name: as_result(value) for name, value in metrics.items()}
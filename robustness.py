@@ -0,0 +1,128 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import risk_metrics
+from strategy_registry import INTEGER, NUMBER
+
+ROBUSTNESS_STATS = ["Strategy Result", "Sharpe ratio", "Max Drawdown"]
+
+# Upper bound of simulated bars held in memory at once by a worker
+CHUNK_CELLS = 5_000_000
+
+# One pool shared by all the requests, its processes are started on first use. Forking a threaded
+# Flask worker can copy locks held by other threads, the workers are spawned instead
+ROBUSTNESS_WORKERS = os.cpu_count() or 1
+ROBUSTNESS_POOL = ProcessPoolExecutor(max_workers=ROBUSTNESS_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+
+def default_block_size(length):
+    return max(1, math.ceil(length ** (1 / 3)))
+
+
+def bootstrap_returns(returns, simulations, block_size, rng):
+    # `returns` has one row per source curve, simulation i draws its blocks from row i modulo the rows
+    rows, length = returns.shape
+    blocks = math.ceil(length / block_size)
+
+    starts = rng.integers(0, length - block_size + 1, size=(simulations, blocks))
+    columns = (starts[:, :, np.newaxis] + np.arange(block_size)).reshape(simulations, -1)[:, :length]
+
+    return returns[(np.arange(simulations) % rows)[:, np.newaxis], columns]
+
+
+def simulate_chunk(returns, interval, simulations, block_size, seed, rfr_annual=risk_metrics.RFR_ANNUAL):
+    rng = np.random.default_rng(seed)
+    batch = max(1, CHUNK_CELLS // returns.shape[1])
+    results = {name: list() for name in ROBUSTNESS_STATS}
+
+    for done in range(0, simulations, batch):
+        paths = bootstrap_returns(returns, min(batch, simulations - done), block_size, rng)
+        equity = np.cumprod(1 + paths, axis=1)
+
+        results["Strategy Result"].append(equity[:, -1] - 1)
+        results["Sharpe ratio"].append(risk_metrics.sharpe_ratio(paths, interval, rfr_annual))
+        results["Max Drawdown"].append(risk_metrics.drawdown(np.pad(equity, ((0, 0), (1, 0)), constant_values=1))[0])
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+# `kinds` maps the parameter names to their schema kind, a number given as a JSON integer is still jittered continuously
+def perturb_parameters(parameters, perturbation, rng, kinds):
+    perturbed = dict()
+    for name, value in parameters.items():
+        kind = kinds.get(name)
+        if kind not in (INTEGER, NUMBER) or isinstance(value, bool) or value == 0:
+            continue
+
+        value = value * (1 + rng.uniform(-perturbation, perturbation))
+        perturbed[name] = max(1, round(value)) if kind == INTEGER else max(0.0, value)
+    return perturbed
+
+
+def summarize(values, confidence):
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return dict()
+
+    tail = (1 - confidence) / 2
+    lower, median, upper = np.quantile(values, [tail, 0.5, 1 - tail])
+    return {
+        "Mean": float(values.mean()),
+        "Median": float(median),
+        "Lower": float(lower),
+        "Upper": float(upper)
+    }
+
+
+def run_robustness(alg, simulations=1000, block_size=None, confidence=0.95, parameters=None, perturbation=0.0,
+                   perturbations=0, engine=None, workers=None, seed=None, rfr_annual=risk_metrics.RFR_ANNUAL):
+    seed_sequence = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+
+    if len(alg.cumulative_returns) == 0:
+        alg.run_backtest(engine)
+    curves = [alg.cumulative_returns]
+    parameters = {name: value for name, value in (parameters or dict()).items() if hasattr(alg, name)}
+    kinds = {name: parameter.kind for name, parameter in alg.PARAMETERS.items()}
+
+    # Reruns with jittered parameters, the simulations are spread over all the resulting curves
+    for _ in range(perturbations if parameters else 0):
+        perturbed = alg.with_parameters(**perturb_parameters(parameters, perturbation, rng, kinds))
+        perturbed.run_backtest(engine)
+        curves.append(perturbed.cumulative_returns)
+
+    length = min(len(curve) for curve in curves)
+    returns = risk_metrics.compute_returns(np.array([curve[:length] for curve in curves]))
+    if returns.shape[1] == 0:
+        raise ValueError("There are not enough bars to resample")
+
+    block_size = min(block_size or default_block_size(returns.shape[1]), returns.shape[1])
+
+    workers = min(workers or ROBUSTNESS_WORKERS, ROBUSTNESS_WORKERS)
+    chunks = max(1, min(workers, math.ceil(simulations * returns.shape[1] / CHUNK_CELLS)))
+    sizes = [simulations // chunks + (1 if i < simulations % chunks else 0) for i in range(chunks)]
+    seeds = seed_sequence.spawn(chunks)
+
+    if chunks == 1:
+        results = [simulate_chunk(returns, alg.interval, sizes[0], block_size, seeds[0], rfr_annual)]
+    else:
+        results = list(ROBUSTNESS_POOL.map(simulate_chunk, [returns] * chunks, [alg.interval] * chunks, sizes,
+                                           [block_size] * chunks, seeds, [rfr_annual] * chunks))
+
+    robustness = {
+        "Simulations": simulations,
+        "Block size": block_size,
+        "Parameter sets": len(curves),
+        "Confidence": confidence
+    }
+    for name in ROBUSTNESS_STATS:
+        values = np.concatenate([result[name] for result in results])
+        robustness[name] = summarize(values, confidence)
+        if name == "Strategy Result":
+            robustness["Probability of loss"] = float((values < 0).mean())
+
+    return robustness
@@ -0,0 +1,78 @@
+STRATEGIES = dict()
+
+INTEGER = 'integer'
+NUMBER = 'number'
+STRING = 'string'
+
+TYPE_CHECKS = {
+    INTEGER: lambda value: type(value) is int,
+    NUMBER: lambda value: type(value) is int or type(value) is float,
+    STRING: lambda value: type(value) is str
+}
+
+
+class Parameter:
+    def __init__(self, kind, default=None, minimum=None, exclusive_minimum=False, check=None, message=None):
+        self.kind = kind
+        self.default = default
+        self.minimum = minimum
+        self.exclusive_minimum = exclusive_minimum
+        self.check = check
+        self.message = message
+
+    # Single predicate with the type, bound and custom checks, built once when the strategy is registered
+    def compile(self):
+        type_check = TYPE_CHECKS[self.kind]
+        minimum = self.minimum
+        check = self.check
+
+        if minimum is None:
+            bounded = type_check
+        elif self.exclusive_minimum:
+            def bounded(value): return type_check(value) and value > minimum
+        else:
+            def bounded(value): return type_check(value) and value >= minimum
+
+        if check is None:
+            return lambda value, data: bounded(value)
+        return lambda value, data: bounded(value) and check(value, data)
+
+    def schema(self):
+        schema = {"type": self.kind}
+        if self.default is not None:
+            schema["default"] = self.default
+        if self.minimum is not None:
+            schema["exclusiveMinimum" if self.exclusive_minimum else "minimum"] = self.minimum
+        return schema
+
+
+def compile_validator(parameters):
+    checks = [
+        (name, parameter.default, parameter.compile(), parameter.message or "The {name} is invalid".format(name=name))
+        for name, parameter in parameters.items()
+    ]
+
+    def validate(data):
+        values = dict()
+        for name, default, accepts, message in checks:
+            value = data.get(name, default)
+            if value is None:
+                continue
+
+            if not accepts(value, data):
+                raise ValueError(message)
+            values[name] = value
+        return values
+
+    return validate
+
+
+# Class decorator, the strategy is then available to every endpoint through its NAME
+def register(cls):
+    cls.validate_parameters = staticmethod(compile_validator(cls.PARAMETERS))
+    cls.configuration = {
+        "parameters": {name: parameter.schema() for name, parameter in cls.PARAMETERS.items()},
+        "engines": cls.ENGINES
+    }
+    STRATEGIES[cls.NAME] = cls
+    return cls
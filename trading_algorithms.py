@@ -1,3 +1,4 @@
+import copy
 import math
 import re
 from abc import ABC, abstractmethod
@@ -6,10 +7,16 @@ import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import plotly.graph_objects as go
-import yfinance as yf
 from plotly.subplots import make_subplots
 
-RFR_ANNUAL = 0.05
+from data_sources import DATA_SOURCE
+from event_engine import FLATTEN, realized_equity
+from market_data import MarketData
+from resampling import INTERVALS, SESSION_CLOSE_HOUR, SESSION_OPEN_HOUR, align, can_resample, interval_minutes, resample
+from strategy_registry import INTEGER, NUMBER, STRING, Parameter, register
+import risk_metrics
+
+RFR_ANNUAL = risk_metrics.RFR_ANNUAL
 RFR_DAILY = (1 + RFR_ANNUAL) ** (1 / 252) - 1
 
 PERIOD_TO_DAYS = {
@@ -19,18 +26,42 @@ PERIOD_TO_DAYS = {
     'y': 252
 }
 
+RATIO_STATS = ["Sharpe ratio", "Sortino ratio", "Calmar ratio", "Median rolling Sharpe ratio", "Positive rolling Sharpe ratio share"]
+
+RSI_NEUTRAL = 50
+
+BENCHMARK_TICKER = "SPY"
+
 
 class TradingAlgorithm(ABC):
+    NAME = None
+    PARAMETERS = dict()
+    ENGINES = ['vectorized', 'event']
+    # Parameters naming another ticker to download, mapped to the constructor argument receiving its data
+    DATA_PARAMETERS = dict()
+    # Whether the indicators of a bar only depend on the bars up to it
+    CAUSAL = True
+
     def __init__(self, ticker, period, interval, benchmark_data):
         self.ticker = ticker
         self.period = period
         self.interval = interval
-        self.benchmark_data = benchmark_data
+        self.benchmark_data = MarketData.from_frame(benchmark_data)
+
+        self.market_data = None
+        self.reset()
+
+    # Market data the strategy reads, used to share and prefetch downloads
+    @classmethod
+    def data_keys(cls, ticker, period, interval, parameters):
+        tickers = [ticker, BENCHMARK_TICKER] + [parameters[name] for name in cls.DATA_PARAMETERS if name in parameters]
+        return [(data_ticker, period, interval) for data_ticker in tickers]
 
+    def reset(self):
         self.data = None
         self.trading_chart = None
         self.progress_chart = None
-        self.cumulative_returns = list()
+        self.cumulative_returns = np.ones(0)
         self.simulation_stats = dict()
         self.trades = {
             "time": [],
@@ -38,10 +69,34 @@ class TradingAlgorithm(ABC):
             "mode": []
         }
 
-    def run_algorithm(self):
+    # Copy sharing the market data, with other parameters and without the results of previous runs
+    def with_parameters(self, **parameters):
+        alg = copy.copy(self)
+        alg.__dict__.update(parameters)
+        alg.reset()
+        return alg
+
+    # Copy trading only the bars in [start, stop) of the prepared data, starting flat
+    def window(self, start, stop):
+        alg = copy.copy(self)
+        data = self.data.iloc[start:stop]
+        alg.reset()
+        alg.data = data
+        if self.market_data is not None:
+            alg.market_data = self.market_data.slice(start, stop)
+        return alg
+
+    def run_backtest(self, engine=None):
         self.prepare_data()
         self.generate_signals()
-        self.execute_trades()
+        if engine is None:
+            self.execute_trades()
+        else:
+            engine.run(self)
+
+    def run_algorithm(self, engine=None):
+        self.run_backtest(engine)
+        self.update_chart()
         self.populate_simulation_stats()
         self.add_entry_exit()
         self.remove_gaps_chart()
@@ -55,34 +110,28 @@ class TradingAlgorithm(ABC):
         pass
 
     def execute_trades(self):
-        current_pos = 0
-        start_price = 0
-        current_sum = 1
-
         try:
-            for index, row in self.data.iterrows():
-                if row["Position"] * current_pos < 0:
-                    # Execute trade
-                    end_price = row["Close"]
-                    current_sum = current_sum * ((end_price / start_price) ** current_pos)
-
-                    # Switch position
-                    current_pos = row["Position"]
-                    start_price = end_price
-
-                    self.trades["price"].append(end_price)
-                    self.trades["time"].append(index)
-                    self.trades["mode"].append(current_pos)
-
-                if current_pos == 0 and row["Position"] in [-1, 1]:
-                    current_pos = row["Position"]
-                    start_price = row["Close"]
-
-                    self.trades["price"].append(start_price)
-                    self.trades["time"].append(index)
-                    self.trades["mode"].append(current_pos)
-
-                self.cumulative_returns.append(current_sum)
+            positions = self.data["Position"].to_numpy()
+            closes = np.asarray(self.market_data["Close"], dtype=np.float64)
+            bars = np.arange(len(positions))
+
+            # The held position is the last non-zero signal, a trade happens every time it changes
+            last_signal = np.maximum.accumulate(np.where(positions != 0, bars, -1))
+            held = np.where(last_signal >= 0, positions[np.maximum(last_signal, 0)], 0)
+            held[held == FLATTEN] = 0
+            trade_bars = np.flatnonzero(np.diff(held, prepend=0) != 0)
+
+            prices = closes[trade_bars]
+            modes = held[trade_bars]
+
+            # Every trade closes the previous position, a trade from flat leaves the equity unchanged
+            factors = np.ones(len(trade_bars))
+            factors[1:] = (prices[1:] / prices[:-1]) ** modes[:-1]
+
+            self.trades["price"].extend(prices.tolist())
+            self.trades["time"].extend(self.data.index[trade_bars])
+            self.trades["mode"].extend(modes.tolist())
+            self.cumulative_returns = realized_equity(trade_bars, np.cumprod(factors), len(positions))
         except Exception as e:
             print(e)
 
@@ -95,8 +144,9 @@ class TradingAlgorithm(ABC):
         return (RFR_DAILY+1) ** round(PERIOD_TO_DAYS[unit] * num) - 1
 
     def compute_alpha(self):
-        benchmark_return = self.benchmark_data.iloc[-1]['Close']/self.benchmark_data.iloc[0]['Close'] - 1
-        beta = yf.Ticker(self.ticker).info.get('beta', 1.0)
+        benchmark_close = self.benchmark_data['Close']
+        benchmark_return = float(benchmark_close[-1] / benchmark_close[0]) - 1
+        beta = DATA_SOURCE.beta(self.ticker)
         rfr = TradingAlgorithm.get_rfr(self.period)
         strategy_return = self.simulation_stats["Strategy Result"]
 
@@ -105,11 +155,11 @@ class TradingAlgorithm(ABC):
     def init_chart(self):
         self.trading_chart.add_trace(
             go.Candlestick(
-                x=self.data.index,
-                open=self.data['Open'],
-                high=self.data['High'],
-                low=self.data['Low'],
-                close=self.data['Close'],
+                x=self.market_data.index,
+                open=self.market_data['Open'],
+                high=self.market_data['High'],
+                low=self.market_data['Low'],
+                close=self.market_data['Close'],
                 name=self.ticker
             )
         )
@@ -123,7 +173,7 @@ class TradingAlgorithm(ABC):
                 y=entry_exit["price"],
                 mode="markers",
                 marker_color=["blue" if e > 0 else "orange" for e in entry_exit["mode"]],
-                hovertemplate=["LONG" if e > 0 else "SHORT" for e in entry_exit["mode"]],
+                hovertemplate=["LONG" if e > 0 else "SHORT" if e < 0 else "EXIT" for e in entry_exit["mode"]],
                 name="Position type"
             ),
         )
@@ -132,55 +182,34 @@ class TradingAlgorithm(ABC):
         pass
 
     def remove_gaps_chart(self):
+        rangebreaks = [dict(bounds=['sat', 'mon'])]  # hide weekends
+        if interval_minutes(self.interval) is not None:
+            rangebreaks.append(dict(bounds=[SESSION_CLOSE_HOUR, SESSION_OPEN_HOUR], pattern='hour'))  # hide nights
+
         self.trading_chart.update_yaxes(fixedrange=False)
-        self.trading_chart.update_xaxes(rangebreaks=[
-            dict(bounds=['sat', 'mon']),  # hide weekends
-        ])
+        self.trading_chart.update_xaxes(rangebreaks=rangebreaks)
 
     def save_chart_html(self):
         self.trading_chart.write_html(r'.\graph.html')
 
-    def sharpe_ratio(self):
-        cumulative_return_df = pd.Series(self.cumulative_returns)
-        returns = cumulative_return_df.pct_change().dropna()
-
-        rfr_per_period = (1 + TradingAlgorithm.get_rfr(self.period)) ** (1 / len(returns)) - 1
-
-        excess_return = returns - rfr_per_period
-
-        sharpe_ratio = excess_return.mean() / excess_return.std(ddof=0)
-
-        return sharpe_ratio
-
-    def sortino_ratio(self):
-        cumulative_return_df = pd.Series(self.cumulative_returns)
-        returns = cumulative_return_df.pct_change().dropna()
-
-        rfr_per_period = (1 + TradingAlgorithm.get_rfr(self.period)) ** (1 / len(returns)) - 1
-
-        excess_return = returns - rfr_per_period
-        downside_deviation = excess_return[excess_return < 0].std(ddof=0)
-        sortino_ratio = excess_return.mean() / downside_deviation
-
-        return sortino_ratio
+    # Entry and exit bar of every closed trade, a reversal closes one trade and opens the next
+    def trade_bounds(self):
+        bars = self.data.index.get_indexer(self.trades["time"])
+        held = np.asarray(self.trades["mode"][:-1]) != 0
+        return np.column_stack([bars[:-1][held], bars[1:][held]])
 
     def populate_simulation_stats(self):
-        self.simulation_stats["Number of trades"] = max(len(self.trades["time"])-1, 0)
-        self.simulation_stats["Profitable trades"] = len(
-            [y for x, y in zip([1] + self.cumulative_returns, self.cumulative_returns) if y > x]
-        )
-        self.simulation_stats["Strategy Result"] = self.cumulative_returns[-1] - 1
-        self.simulation_stats["Max Profit"] = float(np.nanmax(self.cumulative_returns) - 1)
-        self.simulation_stats["Max Loss"] = float(np.nanmin(self.cumulative_returns) - 1)
+        trades = self.trade_bounds()
+        self.simulation_stats["Number of trades"] = len(trades)
 
-        if self.simulation_stats["Number of trades"] > 1:
-            sharpe = self.sharpe_ratio()
-            if not math.isnan(sharpe):
-                self.simulation_stats["Sharpe ratio"] = self.sharpe_ratio()
+        metrics = risk_metrics.compute_metrics(self.cumulative_returns, self.interval, RFR_ANNUAL, trades)
+        for name, value in metrics.items():
+            if name in RATIO_STATS and self.simulation_stats["Number of trades"] <= 1:
+                continue
 
-            sortino = self.sortino_ratio()
-            if not math.isnan(sortino):
-                self.simulation_stats["Sortino ratio"] = sortino
+            # NaN and infinite values can't be stored in DynamoDB
+            if math.isfinite(value):
+                self.simulation_stats[name] = value
 
         self.simulation_stats["Alpha"] = self.compute_alpha()
         self.create_progress_chart()
@@ -192,19 +221,19 @@ class TradingAlgorithm(ABC):
         )
 
         STARTING_MONEY = 100
-        strategy_progress = [STARTING_MONEY * x for x in self.cumulative_returns]
+        strategy_progress = STARTING_MONEY * self.cumulative_returns
 
         self.progress_chart.add_trace(
             go.Scatter(x=self.data.index, y=strategy_progress, marker_color='blue', name='Trading Algorithm'))
 
         if not isinstance(self, Arbitrage):
-            hold_init_price = self.data["Close"].iloc[0]
-            holding_result = [STARTING_MONEY * x / hold_init_price for x in self.data['Close'].tolist()]
+            hold_init_price = float(self.market_data["Close"][0])
+            holding_result = STARTING_MONEY * np.asarray(self.market_data['Close'], dtype=np.float64) / hold_init_price
 
             self.progress_chart.add_trace(
                 go.Scatter(x=self.data.index, y=holding_result, marker_color='red', name='Holding ' + self.ticker))
 
-        benchmark_init_price = self.benchmark_data["Close"].iloc[0]
+        benchmark_init_price = float(self.benchmark_data["Close"][0])
         benchmark_result = [STARTING_MONEY * x / benchmark_init_price for x in self.benchmark_data['Close'].tolist()]
 
         self.progress_chart.add_trace(
@@ -216,32 +245,38 @@ class TradingAlgorithm(ABC):
         )
 
 
+@register
 class MeanReversion(TradingAlgorithm):
+    NAME = 'mean_reversion'
+    PARAMETERS = {
+        'time_window': Parameter(INTEGER, 20, minimum=0, exclusive_minimum=True,
+                                 message="The time window must be strictly positive integer")
+    }
+
     def __init__(self, data, ticker, period, interval, benchmark_data, time_window=20):
         super().__init__(ticker, period, interval, benchmark_data)
-        self.data = data
+        self.market_data = MarketData.from_frame(data)
         self.time_window = time_window
 
     def prepare_data(self):
-        self.data['Moving Average'] = self.data['Close'].rolling(window=self.time_window).mean()
-        self.data['Standard Deviation'] = self.data['Close'].rolling(window=self.time_window).std(ddof=0)
+        close = self.market_data.series('Close')
+
+        self.data = pd.DataFrame(index=self.market_data.index)
+        self.data['Moving Average'] = close.rolling(window=self.time_window).mean()
+        self.data['Standard Deviation'] = close.rolling(window=self.time_window).std(ddof=0)
         self.data['Upper Band'] = self.data['Moving Average'] + (self.data['Standard Deviation'] * 2)
         self.data['Lower Band'] = self.data['Moving Average'] - (self.data['Standard Deviation'] * 2)
         self.data['Signal'] = 0
         self.data['Position'] = 0
 
-        self.update_chart()
-
     def generate_signals(self):
-        for i in range(self.time_window, len(self.data)):
-            if self.data['Close'][i] < self.data['Lower Band'][i]:
-                self.data['Signal'][i] = 1
-            elif self.data['Close'][i] > self.data['Upper Band'][i]:
-                self.data['Signal'][i] = -1
-            else:
-                self.data['Signal'][i] = 0
+        close = self.market_data['Close']
+        signal = np.where(close < self.data['Lower Band'].to_numpy(), 1,
+                          np.where(close > self.data['Upper Band'].to_numpy(), -1, 0))
+        signal[:self.time_window] = 0
 
-            self.data['Position'][i] = self.data['Signal'][i]
+        self.data['Signal'] = signal
+        self.data['Position'] = signal
 
     def update_chart(self):
         self.trading_chart = make_subplots(
@@ -256,34 +291,66 @@ class MeanReversion(TradingAlgorithm):
 
     def populate_simulation_stats(self):
         super().populate_simulation_stats()
-        self.simulation_stats["Holding Result"] = self.data.iloc[-1]["Close"] / self.data.iloc[0]["Close"] - 1
+        close = self.market_data['Close']
+        self.simulation_stats["Holding Result"] = float(close[-1] / close[0]) - 1
+
 
+def is_filter_interval(value, data):
+    interval = data.get("interval", "1d")
+    return value in INTERVALS and value != interval and can_resample(interval, value)
 
+
+@register
 class DoubleRSI(TradingAlgorithm):
-    def __init__(self, data, ticker, period, interval, benchmark_data, rsi_short_period=14, rsi_long_period=28):
+    NAME = 'double_rsi'
+    PARAMETERS = {
+        'rsi_short_period': Parameter(INTEGER, 14, minimum=0, exclusive_minimum=True,
+                                      message="The RSI periods must be positive integers"),
+        'rsi_long_period': Parameter(INTEGER, 28, minimum=0, exclusive_minimum=True,
+                                     message="The RSI periods must be positive integers"),
+        'filter_interval': Parameter(STRING, check=is_filter_interval,
+                                     message="The filter interval must be a multiple of the selected interval")
+    }
+
+    def __init__(self, data, ticker, period, interval, benchmark_data, rsi_short_period=14, rsi_long_period=28,
+                 filter_interval=None):
         super().__init__(ticker, period, interval, benchmark_data)
-        self.data = data
+        self.market_data = MarketData.from_frame(data)
         self.rsi_short_period = rsi_short_period
         self.rsi_long_period = rsi_long_period
+        self.filter_interval = filter_interval
 
     def prepare_data(self):
-        self.data['RSI Short'] = ta.rsi(self.data['Close'], length=self.rsi_short_period, append=True)
-        self.data['RSI Long'] = ta.rsi(self.data['Close'], length=self.rsi_long_period, append=True)
+        close = self.market_data.series('Close')
+
+        self.data = pd.DataFrame(index=self.market_data.index)
+        self.data['RSI Short'] = ta.rsi(close, length=self.rsi_short_period)
+        self.data['RSI Long'] = ta.rsi(close, length=self.rsi_long_period)
+
+        # RSI of the higher timeframe, only trades in its direction are taken
+        if self.filter_interval is not None:
+            higher = resample(self.market_data, self.filter_interval)
+            rsi_filter = ta.rsi(higher.series('Close'), length=self.rsi_short_period)
+            rsi_filter = rsi_filter.to_numpy() if rsi_filter is not None else []
+            self.data['RSI Filter'] = align(rsi_filter, higher.index, self.market_data.index)
+
         self.data['Signal'] = 0
         self.data['Position'] = 0
 
-        self.update_chart()
-
     def generate_signals(self):
-        for i in range(self.rsi_long_period, len(self.data)):
-            if self.data['RSI Short'][i] > self.data['RSI Long'][i]:
-                self.data['Signal'][i] = 1
-            elif self.data['RSI Short'][i] < self.data['RSI Long'][i]:
-                self.data['Signal'][i] = -1
-            else:
-                self.data['Signal'][i] = 0
+        rsi_short = self.data['RSI Short'].to_numpy()
+        rsi_long = self.data['RSI Long'].to_numpy()
+        signal = np.where(rsi_short > rsi_long, 1, np.where(rsi_short < rsi_long, -1, 0))
+        signal[:self.rsi_long_period] = 0
 
-            self.data['Position'][i] = self.data['Signal'][i]
+        if self.filter_interval is not None:
+            rsi_filter = self.data['RSI Filter'].to_numpy()
+            # A signal against the higher timeframe closes the position instead of holding it
+            blocked = ((signal > 0) & ~(rsi_filter > RSI_NEUTRAL)) | ((signal < 0) & ~(rsi_filter < RSI_NEUTRAL))
+            signal[blocked] = FLATTEN
+
+        self.data['Signal'] = signal
+        self.data['Position'] = signal
 
     def update_chart(self):
         self.trading_chart = make_subplots(
@@ -311,37 +378,52 @@ class DoubleRSI(TradingAlgorithm):
 
     def populate_simulation_stats(self):
         super().populate_simulation_stats()
-        self.simulation_stats["Holding Result"] = self.data.iloc[-1]["Close"] / self.data.iloc[0]["Close"] - 1
+        close = self.market_data['Close']
+        self.simulation_stats["Holding Result"] = float(close[-1] / close[0]) - 1
 
 
+@register
 class Arbitrage(TradingAlgorithm):
+    NAME = 'arbitrage'
+    PARAMETERS = {
+        'ticker2': Parameter(STRING, BENCHMARK_TICKER),
+        'entry_threshold': Parameter(NUMBER, 2, minimum=0,
+                                     message="The entry_threshold and exit_threshold must be non-negative numbers"),
+        'exit_threshold': Parameter(NUMBER, 0, minimum=0,
+                                    message="The entry_threshold and exit_threshold must be non-negative numbers")
+    }
+    ENGINES = ['vectorized']
+    DATA_PARAMETERS = {'ticker2': 'arbitrage_data'}
+    # The spread is normalized with the mean and deviation of the whole history
+    CAUSAL = False
+
     def __init__(self, data, ticker, period, interval, benchmark_data,  arbitrage_data, ticker2, entry_threshold=2, exit_threshold=0):
         super().__init__(ticker, period, interval, benchmark_data)
-        self.data1 = data
-        self.data2 = arbitrage_data
+        self.data1 = MarketData.from_frame(data)
+        self.data2 = MarketData.from_frame(arbitrage_data)
         self.entry_threshold = entry_threshold
         self.exit_threshold = exit_threshold
         self.ticker2 = ticker2
 
     def prepare_data(self):
-        self.data = pd.concat([self.data1['Close'], self.data2['Close']], axis=1, join='inner')
+        self.data = pd.concat([self.data1.series('Close'), self.data2.series('Close')], axis=1, join='inner')
+        self.data = self.data.astype(np.float64)
         self.data.columns = ['Data 1', 'Data 2']
         self.data['Spread'] = self.data['Data 1'] - self.data['Data 2']
         self.data['Z-Score'] = (self.data['Spread'] - self.data['Spread'].mean()) / self.data['Spread'].std(ddof=0)
         self.data['Position'] = 0
 
-        self.update_chart()
-
     def generate_signals(self):
-        for i in range(1, len(self.data)):
-            if self.data['Z-Score'][i] > self.entry_threshold:
-                self.data['Position'][i] = -1
-            elif self.data['Z-Score'][i] < -self.entry_threshold:
-                self.data['Position'][i] = 1
-            elif -self.exit_threshold < self.data['Z-Score'][i] < self.exit_threshold:
-                self.data['Position'][i] = 0
-            else:
-                self.data['Position'][i] = self.data['Position'][i - 1]
+        z_score = self.data['Z-Score'].to_numpy()
+
+        # Later assignments take precedence, NaN keeps the previous position
+        position = np.full(len(z_score), np.nan)
+        position[(-self.exit_threshold < z_score) & (z_score < self.exit_threshold)] = 0
+        position[z_score < -self.entry_threshold] = 1
+        position[z_score > self.entry_threshold] = -1
+        position[:1] = 0
+
+        self.data['Position'] = pd.Series(position, index=self.data.index).ffill().astype(int)
 
     def execute_trades(self):
         current_sum = 1
@@ -353,6 +435,7 @@ class Arbitrage(TradingAlgorithm):
         pos_2 = 0
         self.data['Position'] = self.data['Position']
 
+        cumulative_returns = list()
         try:
             for index, row in self.data.iterrows():
                 curr_1 = row["Data 1"]
@@ -373,11 +456,21 @@ class Arbitrage(TradingAlgorithm):
                 prev_1 = curr_1
                 prev_2 = curr_2
 
-                self.cumulative_returns.append(current_sum)
+                cumulative_returns.append(current_sum)
 
         except Exception as e:
             print(e)
 
+        self.cumulative_returns = np.array(cumulative_returns, dtype=np.float64)
+
+    # The curve is marked on every bar in a position, a trade lasts from a change of position to the next one
+    def trade_bounds(self):
+        position = self.data['Position'].to_numpy()
+        changes = np.flatnonzero(np.diff(position, prepend=0) != 0)
+        ends = np.r_[changes[1:], len(position) - 1]
+        held = position[changes] != 0
+        return np.column_stack([changes[held], ends[held]])
+
     def populate_simulation_stats(self):
         super().populate_simulation_stats()
 
@@ -440,9 +533,3 @@ class Arbitrage(TradingAlgorithm):
             row=2, col=1
         )
 
-    def remove_gaps_chart(self):
-        super().remove_gaps_chart()
-        if "m" in self.interval:
-            self.trading_chart.update_xaxes(rangebreaks=[
-                dict(bounds=[16, 9.5], pattern='hour'),
-            ])
@@ -0,0 +1,96 @@
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import risk_metrics
+
+
+def parameter_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def split_windows(length, train_bars, test_bars):
+    return [
+        (start, start + train_bars, min(start + train_bars + test_bars, length))
+        for start in range(0, length - train_bars, test_bars)
+    ]
+
+
+def window_equity(alg, start, stop):
+    window = alg.window(start, stop)
+    window.execute_trades()
+    equity = np.array(window.cumulative_returns, dtype=np.float64)
+
+    # Trades are only realized on reversals, the position still open is closed at the last close of the window
+    if window.trades["time"]:
+        close = float(window.market_data["Close"][-1])
+        equity[-1] *= (close / window.trades["price"][-1]) ** window.trades["mode"][-1]
+    return equity
+
+
+def run_window(candidates, interval, score, train_start, train_end, test_end):
+    # Every candidate is scored on the same bars, so their curves form one matrix for the metrics
+    equity = np.array([window_equity(alg, train_start, train_end) for _, alg in candidates])
+    scores = np.atleast_1d(risk_metrics.compute_metrics(equity, interval)[score])
+    scores = np.where(np.isfinite(scores), scores, -np.inf)
+
+    best = int(np.argmax(scores))
+    parameters, alg = candidates[best]
+
+    return {
+        "parameters": parameters,
+        "in_sample_score": float(scores[best]),
+        "out_of_sample": window_equity(alg, train_end, test_end)
+    }
+
+
+def walk_forward(alg, grid, train_bars, test_bars, score="Sharpe ratio", workers=None):
+    if not alg.CAUSAL:
+        raise ValueError("The {name} algorithm uses the whole history and cannot be walked forward".format(name=alg.NAME))
+
+    # Indicators and signals are computed once per parameter set on the whole history, the windows
+    # only slice them, causal strategies only look back so no window sees bars after its own
+    candidates = list()
+    for parameters in parameter_grid(grid):
+        candidate = alg.with_parameters(**parameters)
+        candidate.prepare_data()
+        candidate.generate_signals()
+        candidates.append((parameters, candidate))
+
+    length = len(candidates[0][1].data)
+    windows = split_windows(length, train_bars, test_bars)
+    if not windows:
+        raise ValueError("There are not enough bars for a training and a test window")
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = list(executor.map(
+            lambda window: run_window(candidates, alg.interval, score, *window),
+            windows
+        ))
+
+    # Each test window starts flat with the equity reached at the end of the previous one
+    equity = list()
+    current_sum = 1.0
+    index = candidates[0][1].data.index
+    for (train_start, train_end, test_end), result in zip(windows, results):
+        curve = result.pop("out_of_sample")
+        equity.extend((curve * current_sum).tolist())
+        current_sum = equity[-1]
+
+        result.update({
+            "train_start": index[train_start],
+            "test_start": index[train_end],
+            "test_end": index[test_end - 1],
+            "out_of_sample_result": float(curve[-1] - 1)
+        })
+
+    stats = risk_metrics.compute_metrics(equity, alg.interval)
+    return {
+        "windows": results,
+        "equity": equity,
+        "index": index[windows[0][1]:windows[-1][2]],
+        "stats": {name: value for name, value in stats.items() if np.isfinite(value)}
+    }